@@ -0,0 +1,102 @@
+import atexit
+import datetime
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import time
+
+_listener = None
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line with the record's structured ``fields`` merged in."""
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.datetime.utcfromtimestamp(record.created).isoformat(timespec="milliseconds") + "Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update(getattr(record, "fields", {}))
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Human-readable lines for local development, fields appended as key=value."""
+
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)-7s %(name)s: %(message)s")
+
+    def format(self, record):
+        line = super().format(record)
+        fields = getattr(record, "fields", None)
+        if fields:
+            line += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        return line
+
+
+def configure_logging(level="INFO", format="json"):
+    """
+    Route all records through a queue to a single stderr handler running in a
+    background thread, so logging never blocks the event loop on terminal or
+    pipe I/O.
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(JsonFormatter() if format == "json" else TextFormatter())
+    records = queue.SimpleQueue()
+    _listener = logging.handlers.QueueListener(records, handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+    root = logging.getLogger()
+    root.handlers = [logging.handlers.QueueHandler(records)]
+    root.setLevel(level.upper())
+
+
+def log(logger, level, message, **fields):
+    """Log ``message`` with structured ``fields``; a no-op below the configured level."""
+    if logger.isEnabledFor(level):
+        logger.log(level, message, extra={"fields": fields})
+
+
+class SampledLogger:
+    """
+    Rate-limits repetitive records: per ``key`` at most one record is emitted
+    every ``interval`` seconds, and it carries the number of records suppressed
+    since the previous one. Meant for warnings that can fire on every request,
+    such as a full write-behind queue or MongoDB being unavailable.
+    """
+
+    def __init__(self, logger, interval=10.0):
+        self.logger = logger
+        self.interval = interval
+        self._next_emit = {}
+        self._suppressed = {}
+
+    def log(self, level, key, message, **fields):
+        if not self.logger.isEnabledFor(level):
+            return
+        now = time.monotonic()
+        if now < self._next_emit.get(key, 0.0):
+            self._suppressed[key] = self._suppressed.get(key, 0) + 1
+            return
+        self._next_emit[key] = now + self.interval
+        suppressed = self._suppressed.pop(key, 0)
+        if suppressed:
+            fields["suppressed"] = suppressed
+        self.logger.log(level, message, extra={"fields": {"event": key, **fields}})
+
+    def warning(self, key, message, **fields):
+        self.log(logging.WARNING, key, message, **fields)
+
+    def error(self, key, message, **fields):
+        self.log(logging.ERROR, key, message, **fields)
@@ -0,0 +1,365 @@
+"""
+Benchmark suite for the learning-style API.
+
+    python benchmark.py micro                 # offline preprocess + predict, batch sizes 1..10k
+    python benchmark.py load --requests 5000  # in-process async load against the FastAPI app
+    python benchmark.py encoding              # request/response bytes and CPU per wire format
+    python benchmark.py all --save-baseline   # run all suites and store the results as the baseline
+
+Every run is compared with the baseline file (benchmark_baseline.json by
+default) when one exists; metrics that got worse by more than --tolerance are
+reported as regressions and make the script exit with status 1.
+
+Feature vectors are replayed from student_performance.csv so the value
+distribution (and with it the tree paths and the cache hit rate) matches real
+traffic. The load generator talks to the ASGI app directly through httpx and
+replaces MongoDB with an in-memory stand-in, so neither a server nor a database
+is needed.
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import platform
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from dataset import load_features_and_target
+from features import FEATURE_COLUMNS
+
+BASELINE_PATH = 'benchmark_baseline.json'
+MICRO_BATCH_SIZES = (1, 10, 100, 1000, 10000)
+
+
+def load_feature_rows(n, seed=0):
+    """Sample ``n`` feature vectors (with replacement) from the training CSV as StudentData dicts."""
+    X, _ = load_features_and_target()
+    rng = np.random.default_rng(seed)
+    sample = X.to_numpy()[rng.integers(0, len(X), size=n)]
+    return [dict(zip(FEATURE_COLUMNS, map(int, row))) for row in sample]
+
+
+def percentiles(samples_ms):
+    values = np.asarray(samples_ms)
+    return {
+        "p50_ms": round(float(np.percentile(values, 50)), 4),
+        "p95_ms": round(float(np.percentile(values, 95)), 4),
+        "p99_ms": round(float(np.percentile(values, 99)), 4),
+        "mean_ms": round(float(values.mean()), 4),
+    }
+
+
+def time_call(fn, min_time=0.2, min_repeats=5, max_repeats=1000):
+    """Call ``fn`` repeatedly and return the per-call latencies in milliseconds."""
+    fn()  # warm-up
+    samples = []
+    started = time.perf_counter()
+    while len(samples) < max_repeats and (len(samples) < min_repeats or time.perf_counter() - started < min_time):
+        call_started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - call_started) * 1000)
+    return samples
+
+
+# --- Microbenchmark ---
+def run_micro(batch_sizes=MICRO_BATCH_SIZES, seed=0):
+    """
+    Time preprocess + predict_proba for each batch size through the plain
+    sklearn objects and through the serving fast paths (compiled preprocessor
+    and forest, with the same batch-size dispatch the API uses).
+    """
+    from serving import load_serving_model
+
+    serving = load_serving_model("local", 'model.pkl', 'preprocessor.pkl', backend="compiled")
+    rows = load_feature_rows(max(batch_sizes), seed)
+
+    paths = {
+        "sklearn": lambda batch: serving.model.predict_proba(
+            serving.preprocessor.transform(pd.DataFrame(batch, columns=FEATURE_COLUMNS))),
+        "serving": lambda batch: serving.predict_proba(
+            serving.preprocess_one(batch[0]) if len(batch) == 1 else serving.preprocess_many(batch)),
+    }
+
+    results = {}
+    for name, predict in paths.items():
+        results[name] = {}
+        for size in batch_sizes:
+            batch = rows[:size]
+            stats = percentiles(time_call(lambda: predict(batch)))
+            stats["rows_per_second"] = round(size / (stats["p50_ms"] / 1000), 1)
+            results[name][str(size)] = stats
+            print(f"  {name:8s} batch={size:<6d} p50={stats['p50_ms']:9.3f} ms  "
+                  f"p99={stats['p99_ms']:9.3f} ms  {stats['rows_per_second']:>12,.0f} rows/s")
+    return results
+
+
+# --- Wire format benchmark ---
+def run_encoding(batch_sizes=(1, 100), seed=0):
+    """
+    Bytes and CPU time per request for decoding the body and encoding the
+    response: the default FastAPI path (json.loads + model validation,
+    jsonable_encoder + JSONResponse), the fast JSON path and the packed format.
+    """
+    from fastapi.encoders import jsonable_encoder
+    from fastapi.responses import JSONResponse
+
+    from main import STUDENT_RECORDS, StudentData, format_prediction
+    from wire_format import FastJSONResponse, decode_features, encode_probabilities
+
+    rows = load_feature_rows(max(batch_sizes), seed)
+    rng = np.random.default_rng(seed)
+
+    results = {}
+    for size in batch_sizes:
+        batch = rows[:size]
+        probabilities = rng.dirichlet(np.ones(4), size=size)
+        predictions = [(p, int(p.argmax())) for p in probabilities]
+        content = {"results": [format_prediction(p, v) for p, v in predictions], "count": size, "status": "success"}
+
+        json_body = json.dumps(batch).encode()
+        packed_body = np.array([[row[c] for c in FEATURE_COLUMNS] for row in batch], dtype=np.uint8).tobytes()
+        formats = {
+            "json": (
+                json_body,
+                lambda: [StudentData.model_validate(record).model_dump() for record in json.loads(json_body)],
+                lambda: JSONResponse(jsonable_encoder(content)).body,
+            ),
+            "json_fast": (
+                json_body,
+                lambda: [record.model_dump() for record in STUDENT_RECORDS.validate_json(json_body)],
+                lambda: FastJSONResponse(content).body,
+            ),
+            "packed": (
+                packed_body,
+                lambda: decode_features(packed_body),
+                lambda: encode_probabilities([p for p, _ in predictions]),
+            ),
+        }
+
+        results[str(size)] = {}
+        for name, (body, decode, encode) in formats.items():
+            decode_stats = percentiles(time_call(decode))
+            encode_stats = percentiles(time_call(encode))
+            stats = {
+                "request_bytes": len(body),
+                "response_bytes": len(encode()),
+                "decode_p50_ms": decode_stats["p50_ms"],
+                "encode_p50_ms": encode_stats["p50_ms"],
+            }
+            results[str(size)][name] = stats
+            print(f"  batch={size:<4d} {name:9s} request={stats['request_bytes']:>7,d} B  "
+                  f"response={stats['response_bytes']:>7,d} B  decode={stats['decode_p50_ms']:8.4f} ms  "
+                  f"encode={stats['encode_p50_ms']:8.4f} ms")
+    return results
+
+
+# --- In-memory MongoDB stand-in ---
+class InMemoryCollection:
+    """The subset of Motor's collection API the prediction endpoints write through."""
+
+    def __init__(self):
+        self.documents = []
+
+    async def create_index(self, keys, **kwargs):
+        return str(keys)
+
+    async def insert_one(self, document):
+        self.documents.append(document)
+        return type("InsertOneResult", (), {"inserted_id": len(self.documents)})()
+
+    async def insert_many(self, documents, ordered=True):
+        start = len(self.documents)
+        self.documents.extend(documents)
+        return type("InsertManyResult", (), {"inserted_ids": list(range(start, len(self.documents)))})()
+
+
+class InMemoryDatabase(dict):
+    def __missing__(self, name):
+        self[name] = InMemoryCollection()
+        return self[name]
+
+    async def command(self, name, *args, **kwargs):
+        return {"ok": 1.0}
+
+
+class InMemoryClient:
+    def __init__(self, *args, **kwargs):
+        self.databases = {}
+        self.admin = InMemoryDatabase()
+
+    def __getitem__(self, name):
+        return self.databases.setdefault(name, InMemoryDatabase())
+
+    def close(self):
+        pass
+
+
+# --- Load generator ---
+async def drive_load(app, payloads, path, concurrency):
+    """Send every payload to ``path`` with ``concurrency`` concurrent clients; returns latencies and stage timings."""
+    import httpx
+
+    latencies, stages, errors = [], {}, 0
+    next_payload = iter(payloads)
+
+    async def client_loop(client):
+        nonlocal errors
+        for payload in next_payload:
+            # Nothing in an in-process request has to wait for I/O; yield like a
+            # socket read would so clients interleave and background tasks run
+            await asyncio.sleep(0)
+            started = time.perf_counter()
+            response = await client.post(path, json=payload)
+            latencies.append((time.perf_counter() - started) * 1000)
+            if response.status_code != 200:
+                errors += 1
+            for item in filter(None, response.headers.get("server-timing", "").split(", ")):
+                stage, _, duration = item.partition(";dur=")
+                stages.setdefault(stage, []).append(float(duration))
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(client_loop(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    return latencies, stages, errors, elapsed
+
+
+async def run_load_async(n_requests, concurrency, batch_size, seed):
+    import main
+
+    # Route the app's MongoDB client to the in-memory stand-in
+    main.AsyncIOMotorClient = InMemoryClient
+    await main.app.router.startup()
+    try:
+        rows = load_feature_rows(n_requests * batch_size, seed)
+        results = {}
+        scenarios = {"predict": ("/predict-style", rows[:n_requests])}
+        if batch_size > 1:
+            batches = [rows[i:i + batch_size] for i in range(0, len(rows), batch_size)]
+            scenarios[f"batch_{batch_size}"] = ("/predict-style/batch", batches)
+
+        for name, (path, payloads) in scenarios.items():
+            latencies, stages, errors, elapsed = await drive_load(main.app, payloads, path, concurrency)
+            stats = percentiles(latencies)
+            stats.update({
+                "requests": len(latencies),
+                "errors": errors,
+                "requests_per_second": round(len(latencies) / elapsed, 1),
+                "stages_mean_ms": {stage: round(float(np.mean(values)), 4) for stage, values in stages.items()},
+            })
+            results[name] = stats
+            print(f"  {name:10s} {stats['requests_per_second']:>9,.1f} req/s  p50={stats['p50_ms']:.3f} ms  "
+                  f"p95={stats['p95_ms']:.3f} ms  p99={stats['p99_ms']:.3f} ms  errors={errors}")
+        return results
+    finally:
+        await main.app.router.shutdown()
+        stored = sum(len(c.documents) for db in main.app.mongodb_client.databases.values() for c in db.values())
+        writer = getattr(main.app, 'prediction_writer', None)
+        dropped = writer.stats()["dropped"] if writer is not None else 0
+        print(f"  {stored} predictions written to the in-memory store, {dropped} dropped by the write-behind queue")
+
+
+def configure_api_environment(cache=True):
+    """
+    Settings main.py reads at import time, so they have to be in place before
+    any suite imports it.
+    """
+    if not cache:
+        os.environ["PREDICTION_CACHE_SIZE"] = "0"
+    os.environ.setdefault("MODEL_WATCH_INTERVAL", "0")
+    os.environ.setdefault("MODEL_LOAD_MODE", "blocking")
+    # The in-memory store only takes inserts; compaction isn't part of the request path
+    os.environ.setdefault("RETENTION_ENABLED", "false")
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+
+def run_load(n_requests=2000, concurrency=16, batch_size=100, seed=0, cache=True):
+    configure_api_environment(cache)
+    return asyncio.run(run_load_async(n_requests, concurrency, batch_size, seed))
+
+
+# --- Baseline comparison ---
+def flatten(results, prefix=""):
+    """Flatten nested results to {"micro.sklearn.1.p50_ms": value} for the metrics compared against the baseline."""
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            if key != "stages_mean_ms":
+                flat.update(flatten(value, f"{name}."))
+        elif key in ("p50_ms", "p95_ms", "p99_ms", "requests_per_second", "rows_per_second",
+                     "decode_p50_ms", "encode_p50_ms"):
+            flat[name] = value
+    return flat
+
+
+def compare(results, baseline, tolerance):
+    """Return the metrics that are worse than the baseline by more than ``tolerance`` (a fraction)."""
+    regressions = []
+    current, previous = flatten(results), flatten(baseline)
+    for name, value in sorted(current.items()):
+        old = previous.get(name)
+        if not old:
+            continue
+        higher_is_better = name.endswith("_per_second")
+        change = (old - value) / old if higher_is_better else (value - old) / old
+        if change > tolerance:
+            regressions.append((name, old, value, change))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the learning-style prediction path.")
+    parser.add_argument('suite', choices=('micro', 'encoding', 'load', 'all'), nargs='?', default='all')
+    parser.add_argument('--requests', type=int, default=2000, help="Requests per load scenario")
+    parser.add_argument('--concurrency', type=int, default=16, help="Concurrent clients in the load generator")
+    parser.add_argument('--batch-size', type=int, default=100, help="Rows per /predict-style/batch request (1 skips it)")
+    parser.add_argument('--no-cache', action='store_true', help="Disable the prediction cache during the load test")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--baseline', type=str, default=BASELINE_PATH)
+    parser.add_argument('--save-baseline', action='store_true', help="Store these results as the new baseline")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="Allowed slowdown before a metric counts as a regression")
+    args = parser.parse_args()
+    configure_api_environment(cache=not args.no_cache)
+
+    results = {}
+    if args.suite in ('micro', 'all'):
+        print("Microbenchmark (preprocess + predict_proba):")
+        results["micro"] = run_micro(seed=args.seed)
+    if args.suite in ('encoding', 'all'):
+        print("Wire formats (per request):")
+        results["encoding"] = run_encoding(seed=args.seed)
+    if args.suite in ('load', 'all'):
+        print(f"Load test ({args.requests} requests, concurrency {args.concurrency}):")
+        results["load"] = run_load(args.requests, args.concurrency, args.batch_size, args.seed, cache=not args.no_cache)
+
+    status = 0
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline.get("results", {}), args.tolerance)
+        for name, old, new, change in regressions:
+            print(f"❌ Regression in {name}: {old} -> {new} ({change:+.0%})")
+        if not regressions:
+            print(f"✅ No regressions beyond {args.tolerance:.0%} against '{args.baseline}'")
+        status = 1 if regressions else 0
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump({
+                "created_at": datetime.datetime.utcnow().isoformat(),
+                "python": sys.version.split()[0],
+                "machine": platform.platform(),
+                "results": results,
+            }, f, indent=2)
+        print(f"✅ Baseline saved to '{args.baseline}'")
+    sys.exit(status)
+
+
+if __name__ == "__main__":
+    main()
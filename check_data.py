@@ -1,6 +1,6 @@
-import pandas as pd
+from dataset import load_dataset
 
-df = pd.read_csv('student_performance.csv')
+df = load_dataset()
 print("Data types:")
 print(df.dtypes)
 print("\nSample data:")
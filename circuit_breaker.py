@@ -0,0 +1,103 @@
+import contextlib
+import time
+
+from pymongo.errors import ConnectionFailure, ExecutionTimeout
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a dependency while its circuit is open."""
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker for calls to a remote dependency.
+
+    After ``failure_threshold`` consecutive failures the circuit opens and
+    ``allow`` returns False for ``reset_timeout`` seconds, so callers skip the
+    dependency instead of each waiting for its timeout. Once the cool-down has
+    passed one trial call is let through per ``reset_timeout`` (half-open); a
+    success closes the circuit, a failure keeps it open for another cool-down.
+
+    Only connectivity errors count as failures: a duplicate key or a bad query
+    says nothing about whether the server is reachable.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0,
+                 failure_exceptions=(ConnectionFailure, ExecutionTimeout, CircuitOpenError)):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failure_exceptions = failure_exceptions
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self._next_trial = 0.0
+
+        self.opens = 0
+        self.rejected = 0
+        self.last_error = None
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return self.CLOSED
+        return self.HALF_OPEN if time.monotonic() >= self._next_trial else self.OPEN
+
+    def retry_after(self):
+        """Seconds until the next trial call is allowed (0 when calls are allowed now)."""
+        if self.opened_at is None:
+            return 0.0
+        return max(0.0, self._next_trial - time.monotonic())
+
+    def allow(self):
+        if self.opened_at is None:
+            return True
+        now = time.monotonic()
+        if now >= self._next_trial:
+            # Let a single trial through; if its outcome is never recorded the
+            # next one follows after another cool-down
+            self._next_trial = now + self.reset_timeout
+            return True
+        self.rejected += 1
+        return False
+
+    def record_success(self):
+        self.consecutive_failures = 0
+        self.opened_at = None
+
+    def record_failure(self, error=None):
+        self.consecutive_failures += 1
+        if error is not None:
+            self.last_error = str(error)
+        if self.opened_at is not None or self.consecutive_failures >= self.failure_threshold:
+            self.trip()
+
+    def trip(self):
+        """Open the circuit now, e.g. when the dependency is already known to be down."""
+        now = time.monotonic()
+        if self.opened_at is None:
+            self.opens += 1
+            self.opened_at = now
+        self._next_trial = now + self.reset_timeout
+
+    @contextlib.contextmanager
+    def track(self):
+        """Record the outcome of the calls made inside the block."""
+        try:
+            yield
+        except self.failure_exceptions as e:
+            self.record_failure(e)
+            raise
+        self.record_success()
+
+    def stats(self):
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "failure_threshold": self.failure_threshold,
+            "reset_timeout_seconds": self.reset_timeout,
+            "retry_after_seconds": round(self.retry_after(), 1),
+            "opens": self.opens,
+            "rejected": self.rejected,
+            "last_error": self.last_error,
+        }
@@ -1,82 +1,334 @@
+import argparse
+import datetime
+import itertools
+import json
+import os
+import pickle
+import time
+
+import joblib
+import numpy as np
 import pandas as pd
+import sklearn
+from joblib import Parallel, delayed
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.metrics import accuracy_score
-from sklearn.model_selection import train_test_split
+from sklearn.model_selection import StratifiedKFold
 from sklearn.preprocessing import OneHotEncoder
 from sklearn.compose import ColumnTransformer
-import joblib
 
-def train_and_save_model():
-    # Load the original dataset
-    df = pd.read_csv('student_performance.csv')
-    
-    # Separate features (X) and the target variable (y)
-    X = df.drop('LearningStyle', axis=1)
-    y = df['LearningStyle']
+import model_registry
+from dataset import load_training_split
+from forest_engine import CompiledForest
+from serving import export_compiled_artifact
+
+# Identify categorical and numerical features
+CATEGORICAL_FEATURES = ['Gender', 'Motivation', 'Extracurricular']
+NUMERICAL_FEATURES = ['StudyHours', 'Attendance', 'AssignmentCompletion', 'OnlineCourses', 'Discussions', 'Resources', 'Internet', 'EduTech', 'StressLevel', 'ExamScore', 'FinalGrade', 'Age']
+
+# Hyperparameters searched by default; every combination is tried with every seed.
+# Shallower and smaller forests are included so a latency budget has options.
+PARAM_GRID = {
+    'n_estimators': [50, 100, 200],
+    'max_depth': [None, 12, 20],
+    'min_samples_leaf': [1, 2],
+    'max_features': ['sqrt'],
+}
+SEEDS = [43, 44, 45]
+
+# Same split as the API: batches up to this size are served by the compiled engine
+COMPILED_MAX_ROWS = int(os.getenv("COMPILED_MAX_ROWS", "64"))
 
-    # Identify categorical and numerical features
-    categorical_features = ['Gender', 'Motivation', 'Extracurricular']
-    numerical_features = ['StudyHours', 'Attendance', 'AssignmentCompletion', 'OnlineCourses', 'Discussions', 'Resources', 'Internet', 'EduTech', 'StressLevel', 'ExamScore', 'FinalGrade', 'Age']
+# Small student forests trained on the labels of the most accurate teacher
+DISTILL_GRID = [
+    {'n_estimators': 20, 'max_depth': 10, 'min_samples_leaf': 5},
+    {'n_estimators': 40, 'max_depth': 14, 'min_samples_leaf': 3},
+]
 
+RESULTS_PATH = 'training_results.csv'
+METADATA_PATH = 'model_metadata.json'
+
+
+def build_preprocessor():
     # Create a preprocessor pipeline
-    preprocessor = ColumnTransformer(
+    return ColumnTransformer(
         transformers=[
-            ('num', 'passthrough', numerical_features),  # Keep numerical data as-is
-            ('cat', OneHotEncoder(handle_unknown='ignore'), categorical_features)  # Encode categorical data
+            ('num', 'passthrough', NUMERICAL_FEATURES),  # Keep numerical data as-is
+            ('cat', OneHotEncoder(handle_unknown='ignore'), CATEGORICAL_FEATURES)  # Encode categorical data
         ],
         remainder='drop'  # Drop any columns not specified
     )
-    
-    # Split the data first, then apply preprocessing to avoid data leakage
-    X_train, X_test, y_train, y_test = train_test_split(
-        X, y, test_size=0.2, random_state=42, stratify=y
+
+
+def expand_grid(param_grid, seeds):
+    """Every combination of the grid values, once per seed."""
+    keys = sorted(param_grid)
+    return [
+        {**dict(zip(keys, values)), 'random_state': seed}
+        for values in itertools.product(*(param_grid[key] for key in keys))
+        for seed in seeds
+    ]
+
+
+def synthesize_rows(X_raw, n_rows, seed=0):
+    """
+    Unlabelled rows for distillation: every column is resampled independently
+    from its training marginal, which covers combinations the data never shows.
+    """
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({col: rng.choice(X_raw[col].to_numpy(), size=n_rows) for col in X_raw.columns})
+
+
+def fit_forest(params, X, y, n_jobs=1):
+    model = RandomForestClassifier(n_jobs=n_jobs, **params)
+    model.fit(X, y)
+    # Serve with single-threaded prediction; joblib dispatch dominates small requests
+    model.set_params(n_jobs=None)
+    return model
+
+
+def fit_distilled(teacher, student_params, X, X_synthetic, n_jobs=1):
+    """Train a small forest to reproduce the teacher's predictions on real and synthetic rows."""
+    X_student = np.vstack([X, X_synthetic])
+    return fit_forest(student_params, X_student, teacher.predict(X_student), n_jobs)
+
+
+def evaluate_candidate(candidate, X, y, folds, X_synthetic=None):
+    """
+    Score one candidate with stratified k-fold CV on the shared, preprocessed
+    matrix. Distilled candidates refit their teacher inside every fold so the
+    validation rows never influence the student.
+    """
+    scores, fit_seconds, predict_seconds = [], 0.0, 0.0
+    for train_idx, valid_idx in folds:
+        started = time.perf_counter()
+        if candidate['kind'] == 'distilled':
+            teacher = fit_forest(candidate['teacher'], X[train_idx], y[train_idx])
+            model = fit_distilled(teacher, candidate['params'], X[train_idx], X_synthetic)
+        else:
+            model = fit_forest(candidate['params'], X[train_idx], y[train_idx])
+        fitted = time.perf_counter()
+        scores.append(accuracy_score(y[valid_idx], model.predict(X[valid_idx])))
+        fit_seconds += fitted - started
+        predict_seconds += time.perf_counter() - fitted
+    return {
+        'cv_accuracy': float(np.mean(scores)),
+        'cv_std': float(np.std(scores)),
+        'fit_seconds': round(fit_seconds, 3),
+        'predict_seconds': round(predict_seconds, 3),
+    }
+
+
+def time_calls(predict_proba, X, repeats):
+    predict_proba(X)  # warm up
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        predict_proba(X)
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+def measure_serving_cost(model, X_sample, repeats=50, batch_size=1000, compiled_max_rows=COMPILED_MAX_ROWS):
+    """
+    Single-row and batch latency the way the API serves the model: batches of
+    up to ``compiled_max_rows`` rows through the compiled engine, larger ones
+    through sklearn. The plain sklearn single-row latency and the size of the
+    pickled model are recorded alongside.
+    """
+    compiled = CompiledForest(model)
+
+    def serve(X):
+        return compiled.predict_proba(X) if X.shape[0] <= compiled_max_rows else model.predict_proba(X)
+
+    row = X_sample[:1]
+    single = time_calls(serve, row, repeats)
+    sklearn_single = time_calls(model.predict_proba, row, repeats)
+
+    batch = X_sample[:batch_size]
+    batch_ms = float(np.median(time_calls(serve, batch, 3)))
+
+    return {
+        'single_row_p50_ms': round(float(np.percentile(single, 50)), 3),
+        'single_row_p95_ms': round(float(np.percentile(single, 95)), 3),
+        'sklearn_single_row_p50_ms': round(float(np.percentile(sklearn_single, 50)), 3),
+        'compiled_max_rows': compiled_max_rows,
+        'batch_rows': int(len(batch)),
+        'batch_ms': round(batch_ms, 3),
+        'batch_us_per_row': round(batch_ms * 1000 / len(batch), 3),
+        'model_mb': round(len(pickle.dumps(model, protocol=pickle.HIGHEST_PROTOCOL)) / 1e6, 3),
+        'node_count': int(sum(estimator.tree_.node_count for estimator in model.estimators_)),
+    }
+
+
+def within_budget(cost, max_latency_ms=None, max_model_mb=None):
+    if max_latency_ms is not None and cost['single_row_p50_ms'] > max_latency_ms:
+        return False
+    if max_model_mb is not None and cost['model_mb'] > max_model_mb:
+        return False
+    return True
+
+
+def train_and_save_model(param_grid=PARAM_GRID, seeds=SEEDS, n_folds=5, n_jobs=-1,
+                         max_latency_ms=None, max_model_mb=None, distill=True,
+                         registry_dir='models', activate=True):
+    # Split the data first, then apply preprocessing to avoid data leakage. The
+    # parsed dataset and the preprocessed matrices are cached on disk, keyed
+    # on the data hash, so repeated runs skip both steps.
+    split = load_training_split(build_preprocessor, test_size=0.2, random_state=42)
+    preprocessor = split.preprocessor
+    X_train_processed, X_test_processed = split.X_train_processed, split.X_test_processed
+    y_train, y_test = split.y_train, split.y_test
+    X_synthetic = preprocessor.transform(synthesize_rows(split.X_train, len(split.X_train)))
+
+    folds = list(StratifiedKFold(n_splits=n_folds, shuffle=True, random_state=42).split(X_train_processed, y_train))
+    candidates = [{'kind': 'forest', 'params': params} for params in expand_grid(param_grid, seeds)]
+    print(f"Evaluating {len(candidates)} candidates with {n_folds}-fold CV (n_jobs={n_jobs})...")
+
+    # joblib memory-maps the large matrices into the worker processes
+    started = time.perf_counter()
+    scores = Parallel(n_jobs=n_jobs, verbose=0)(
+        delayed(evaluate_candidate)(candidate, X_train_processed, y_train, folds) for candidate in candidates
     )
-    
-    # Apply the preprocessor to the data
-    X_train_processed = preprocessor.fit_transform(X_train)
-    X_test_processed = preprocessor.transform(X_test)
-
-    # Train the model multiple times to get the best accuracy
-    best_accuracy = 0.0
-    best_model = None
-    training_runs = 3  # Train 3 times total (original + 2 more)
-    
-    print(f"Training the model {training_runs} times to find the best performance...")
-    
-    for run in range(1, training_runs + 1):
-        print(f"\n--- Training Run {run} ---")
-        
-        # Use different random states for each run to get different results
-        model = RandomForestClassifier(
-            random_state=42 + run,  # Different seed for each run
-            n_estimators=100,       # Number of trees
-            max_depth=None,         # No limit on depth
-            min_samples_split=2,    # Minimum samples to split
-            min_samples_leaf=1      # Minimum samples in leaf
+
+    # Distil the most accurate forest into smaller students
+    if distill:
+        teacher = candidates[int(np.argmax([score['cv_accuracy'] for score in scores]))]['params']
+        students = [
+            {'kind': 'distilled', 'params': {**params, 'random_state': teacher['random_state']}, 'teacher': teacher}
+            for params in DISTILL_GRID
+        ]
+        print(f"Distilling {len(students)} student forests from {teacher}...")
+        scores += Parallel(n_jobs=n_jobs, verbose=0)(
+            delayed(evaluate_candidate)(student, X_train_processed, y_train, folds, X_synthetic)
+            for student in students
         )
-        
-        model.fit(X_train_processed, y_train)
-        print(f"Model {run} trained successfully!")
-
-        # Evaluate the model
-        y_pred = model.predict(X_test_processed)
-        accuracy = accuracy_score(y_test, y_pred)
-        print(f"Model {run} accuracy: {accuracy:.4f}")
-        
-        # Keep track of the best model
-        if accuracy > best_accuracy:
-            best_accuracy = accuracy
-            best_model = model
-            print(f"New best model found! Accuracy: {best_accuracy:.4f}")
-    
+        candidates += students
+    search_seconds = time.perf_counter() - started
+
+    # Fit every candidate on the full training split to measure what it costs to serve
+    teachers = {}
+
+    def fit_final(candidate):
+        if candidate['kind'] == 'distilled':
+            key = json.dumps(candidate['teacher'], sort_keys=True)
+            if key not in teachers:
+                teachers[key] = fit_forest(candidate['teacher'], X_train_processed, y_train, n_jobs)
+            return fit_distilled(teachers[key], candidate['params'], X_train_processed, X_synthetic, n_jobs)
+        return fit_forest(candidate['params'], X_train_processed, y_train, n_jobs)
+
+    print("Measuring serving cost of every candidate...")
+    results = []
+    best, best_model = None, None
+    for candidate, score in zip(candidates, scores):
+        model = fit_final(candidate)
+        cost = measure_serving_cost(model, X_test_processed)
+        result = {
+            'kind': candidate['kind'],
+            **candidate['params'],
+            **score,
+            **cost,
+            'within_budget': within_budget(cost, max_latency_ms, max_model_mb),
+        }
+        results.append(result)
+
+        # Most accurate within budget wins; if nothing fits, fall back to the fastest
+        if best is None:
+            better = True
+        elif result['within_budget'] != best['within_budget']:
+            better = result['within_budget']
+        elif result['within_budget']:
+            better = (result['cv_accuracy'], -result['single_row_p50_ms']) > \
+                (best['cv_accuracy'], -best['single_row_p50_ms'])
+        else:
+            better = result['single_row_p50_ms'] < best['single_row_p50_ms']
+        if better:
+            best, best_model, best_candidate, serving_cost = result, model, candidate, cost
+
+    results_df = pd.DataFrame(results).sort_values(['within_budget', 'cv_accuracy'], ascending=[False, False])
+    results_df.to_csv(RESULTS_PATH, index=False)
+    print(results_df.to_string(index=False))
+
+    if not best['within_budget']:
+        print("⚠ No candidate meets the budget - choosing the fastest one")
+
+    # Evaluate the chosen model on the held-out test set
+    test_accuracy = accuracy_score(y_test, best_model.predict(X_test_processed))
+
     print(f"\n=== FINAL RESULTS ===")
-    print(f"Best model accuracy: {best_accuracy:.4f}")
-    print(f"Training completed with {training_runs} runs.")
+    print(f"Chosen {best_candidate['kind']} model: {best_candidate['params']}")
+    print(f"CV accuracy: {best['cv_accuracy']:.4f}, held-out test accuracy: {test_accuracy:.4f}")
+    print(f"Serving cost: {serving_cost}")
+    print(f"Search took {search_seconds:.1f}s for {len(candidates)} candidates.")
 
     # Save the best model and the preprocessor for later use
     joblib.dump(best_model, 'model.pkl')
     joblib.dump(preprocessor, 'preprocessor.pkl')
-    print("Best model and preprocessor saved as 'model.pkl' and 'preprocessor.pkl'.")
+    # Precompiled arrays let the API start without unpickling the forest
+    if export_compiled_artifact('model.pkl', 'preprocessor.pkl', 'model_compiled'):
+        print("Compiled serving artifact written to 'model_compiled'.")
+
+    metadata = {
+        'trained_at': datetime.datetime.utcnow().isoformat(),
+        'kind': best_candidate['kind'],
+        'params': best_candidate['params'],
+        'teacher_params': best_candidate.get('teacher'),
+        'cv_folds': n_folds,
+        'cv_accuracy': best['cv_accuracy'],
+        'cv_std': best['cv_std'],
+        'test_accuracy': float(test_accuracy),
+        'budget': {'max_latency_ms': max_latency_ms, 'max_model_mb': max_model_mb},
+        'within_budget': bool(best['within_budget']),
+        'serving_cost': serving_cost,
+        'n_candidates': len(candidates),
+        'search_seconds': round(search_seconds, 2),
+        'n_train': int(len(y_train)),
+        'n_test': int(len(y_test)),
+        'sklearn_version': sklearn.__version__,
+        'results_file': RESULTS_PATH,
+    }
+    # Publish a new registry version; the API hot-reloads it once it is CURRENT
+    if registry_dir:
+        # Compiled before activation so the API never has to compile it itself
+        version = model_registry.publish(registry_dir, best_model, preprocessor, metadata, activate=False)
+        export_compiled_artifact(*model_registry.version_paths(registry_dir, version),
+                                 os.path.join(model_registry.version_dir(registry_dir, version), 'compiled'))
+        if activate:
+            model_registry.set_current_version(registry_dir, version)
+        metadata['version'] = version
+        print(f"Published model version {version} to '{registry_dir}'" + (" and made it current." if activate else "."))
+
+    with open(METADATA_PATH, 'w') as f:
+        json.dump(metadata, f, indent=2)
+    print(f"Best model and preprocessor saved as 'model.pkl' and 'preprocessor.pkl', metadata in '{METADATA_PATH}'.")
+    return best_model, preprocessor, metadata
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Train the learning style model with a parallel CV search.")
+    parser.add_argument('--folds', type=int, default=5, help="Number of stratified CV folds")
+    parser.add_argument('--seeds', type=str, default=','.join(map(str, SEEDS)), help="Comma-separated random seeds")
+    parser.add_argument('--grid', type=str, default=None, help="JSON object overriding PARAM_GRID")
+    parser.add_argument('--n-jobs', type=int, default=-1, help="Worker processes (-1 uses all cores)")
+    parser.add_argument('--max-latency-ms', type=float, default=None,
+                        help="Budget for median single-row latency as served (compiled engine)")
+    parser.add_argument('--max-model-mb', type=float, default=None, help="Budget for the pickled model size")
+    parser.add_argument('--no-distill', action='store_true', help="Skip the distilled student candidates")
+    parser.add_argument('--registry', type=str, default='models', help="Model registry directory ('' to skip)")
+    parser.add_argument('--no-activate', action='store_true', help="Publish without making the version current")
+    return parser.parse_args()
+
 
 if __name__ == '__main__':
-    train_and_save_model()
\ No newline at end of file
+    args = parse_args()
+    train_and_save_model(
+        param_grid=json.loads(args.grid) if args.grid else PARAM_GRID,
+        seeds=[int(seed) for seed in args.seeds.split(',')],
+        n_folds=args.folds,
+        n_jobs=args.n_jobs,
+        max_latency_ms=args.max_latency_ms,
+        max_model_mb=args.max_model_mb,
+        distill=not args.no_distill,
+        registry_dir=args.registry,
+        activate=not args.no_activate,
+    )
@@ -0,0 +1,154 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import joblib
+import numpy as np
+import pandas as pd
+import sklearn
+from sklearn.model_selection import train_test_split
+
+from features import FEATURE_COLUMNS
+
+DATA_PATH = 'student_performance.csv'
+CACHE_DIR = '.data_cache'
+TARGET_COLUMN = 'LearningStyle'
+
+# Every column is a small non-negative integer (see features.FEATURE_RANGES),
+# so one byte per value is enough instead of pandas' default int64
+COLUMN_DTYPES = {column: np.int8 for column in FEATURE_COLUMNS + [TARGET_COLUMN]}
+
+
+def data_hash(path=DATA_PATH):
+    """SHA-256 of the file contents; every cache entry is keyed on it."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _write_atomically(directory, write):
+    """Run ``write(staging_dir)`` and rename the result into place, so readers never see a partial entry."""
+    parent = os.path.dirname(os.path.abspath(directory))
+    os.makedirs(parent, exist_ok=True)
+    staging = tempfile.mkdtemp(prefix='.staging-', dir=parent)
+    try:
+        write(staging)
+        os.replace(staging, directory)
+    except OSError:
+        # Another process finished the same entry first
+        shutil.rmtree(staging, ignore_errors=True)
+        if not os.path.isdir(directory):
+            raise
+    except Exception:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+
+def parse_csv(path=DATA_PATH):
+    """
+    Parse the CSV with explicit compact dtypes. Values are read as int32 and
+    range-checked before narrowing, because pandas silently wraps values that
+    overflow a requested dtype.
+    """
+    df = pd.read_csv(path, usecols=list(COLUMN_DTYPES), dtype={column: np.int32 for column in COLUMN_DTYPES})
+    for column, dtype in COLUMN_DTYPES.items():
+        bounds = np.iinfo(dtype)
+        if df[column].min() < bounds.min or df[column].max() > bounds.max:
+            raise ValueError(f"Column {column} has values outside the {np.dtype(dtype).name} range")
+    return df.astype(COLUMN_DTYPES)[FEATURE_COLUMNS + [TARGET_COLUMN]]
+
+
+def load_columns(path=DATA_PATH, cache_dir=CACHE_DIR, mmap_mode='r'):
+    """
+    Return {column: array} for the dataset, parsing the CSV only the first
+    time. Each column is cached as its own .npy file under
+    ``cache_dir/<data hash>/columns`` and memory-mapped on later calls.
+    """
+    directory = os.path.join(cache_dir, data_hash(path)[:16], 'columns')
+    if not os.path.isdir(directory):
+        df = parse_csv(path)
+
+        def write(staging):
+            for column in df.columns:
+                np.save(os.path.join(staging, f'{column}.npy'), df[column].to_numpy())
+            with open(os.path.join(staging, 'meta.json'), 'w') as f:
+                json.dump({'source': os.path.basename(path), 'rows': len(df), 'columns': list(df.columns)}, f)
+
+        _write_atomically(directory, write)
+
+    with open(os.path.join(directory, 'meta.json')) as f:
+        columns = json.load(f)['columns']
+    return {column: np.load(os.path.join(directory, f'{column}.npy'), mmap_mode=mmap_mode) for column in columns}
+
+
+def load_dataset(path=DATA_PATH, cache_dir=CACHE_DIR):
+    """The dataset as a DataFrame with int8 columns, served from the columnar cache."""
+    return pd.DataFrame(load_columns(path, cache_dir), copy=False)
+
+
+def load_features_and_target(path=DATA_PATH, cache_dir=CACHE_DIR):
+    df = load_dataset(path, cache_dir)
+    return df[FEATURE_COLUMNS], df[TARGET_COLUMN]
+
+
+class TrainingSplit:
+    """Raw and preprocessed train/test matrices plus the preprocessor fitted on the training rows."""
+
+    def __init__(self, X_train, X_test, y_train, y_test, X_train_processed, X_test_processed, preprocessor, key):
+        self.X_train = X_train
+        self.X_test = X_test
+        self.y_train = y_train
+        self.y_test = y_test
+        self.X_train_processed = X_train_processed
+        self.X_test_processed = X_test_processed
+        self.preprocessor = preprocessor
+        self.key = key
+
+
+def load_training_split(build_preprocessor, test_size=0.2, random_state=42,
+                        path=DATA_PATH, cache_dir=CACHE_DIR, mmap_mode='r'):
+    """
+    Stratified train/test split with the preprocessor fitted on the training
+    rows only. The fitted ColumnTransformer and both transformed matrices are
+    cached under a key made of the data hash, the split parameters, the
+    preprocessor configuration and the scikit-learn version, so repeated runs
+    skip preprocessing and memory-map the matrices instead.
+    """
+    digest = data_hash(path)
+    config = joblib.hash((build_preprocessor(), test_size, random_state, sklearn.__version__))
+    key = f"{digest[:16]}-{config[:16]}"
+    directory = os.path.join(cache_dir, digest[:16], f'preprocessed-{config[:16]}')
+
+    X, y = load_features_and_target(path, cache_dir)
+    if not os.path.isdir(directory):
+        train_index, test_index = train_test_split(
+            np.arange(len(X)), test_size=test_size, random_state=random_state, stratify=y
+        )
+        preprocessor = build_preprocessor()
+        X_train_processed = preprocessor.fit_transform(X.iloc[train_index])
+        X_test_processed = preprocessor.transform(X.iloc[test_index])
+
+        def write(staging):
+            np.save(os.path.join(staging, 'train_index.npy'), train_index)
+            np.save(os.path.join(staging, 'test_index.npy'), test_index)
+            np.save(os.path.join(staging, 'X_train.npy'), np.ascontiguousarray(X_train_processed))
+            np.save(os.path.join(staging, 'X_test.npy'), np.ascontiguousarray(X_test_processed))
+            joblib.dump(preprocessor, os.path.join(staging, 'preprocessor.pkl'))
+
+        _write_atomically(directory, write)
+
+    def array(name):
+        return np.load(os.path.join(directory, f'{name}.npy'), mmap_mode=mmap_mode)
+
+    train_index, test_index = array('train_index'), array('test_index')
+    return TrainingSplit(
+        X.iloc[train_index], X.iloc[test_index],
+        y.to_numpy()[train_index], y.to_numpy()[test_index],
+        array('X_train'), array('X_test'),
+        joblib.load(os.path.join(directory, 'preprocessor.pkl')),
+        key,
+    )
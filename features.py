@@ -0,0 +1,167 @@
+import numpy as np
+
+# pandas and scikit-learn are imported where they are needed: the API imports
+# this module at startup, and serving from a compiled artifact needs neither
+
+# Raw StudentData fields in the order the preprocessor was fitted on
+FEATURE_COLUMNS = [
+    'StudyHours', 'Attendance', 'Resources', 'Extracurricular', 'Motivation',
+    'Internet', 'Gender', 'Age', 'OnlineCourses', 'Discussions',
+    'AssignmentCompletion', 'ExamScore', 'EduTech', 'StressLevel', 'FinalGrade'
+]
+
+# Inclusive (min, max) ranges, mirroring the StudentData field constraints
+FEATURE_RANGES = {
+    'StudyHours': (0, 100),
+    'Attendance': (0, 100),
+    'Resources': (0, 10),
+    'Extracurricular': (0, 1),
+    'Motivation': (0, 2),
+    'Internet': (0, 1),
+    'Gender': (0, 1),
+    'Age': (10, 100),
+    'OnlineCourses': (0, 50),
+    'Discussions': (0, 10),
+    'AssignmentCompletion': (0, 100),
+    'ExamScore': (0, 100),
+    'EduTech': (0, 1),
+    'StressLevel': (0, 10),
+    'FinalGrade': (0, 10),
+}
+
+STYLE_NAMES = ['Visual', 'Auditory', 'Kinesthetic', 'Reading/Writing']
+
+
+def feature_key(input_dict):
+    """Canonical hashable key for a StudentData dict."""
+    return tuple(input_dict[col] for col in FEATURE_COLUMNS)
+
+
+def to_feature_matrix(input_dicts):
+    """Stack raw StudentData dicts into an (n, 15) array in FEATURE_COLUMNS order."""
+    return np.array([[d[col] for col in FEATURE_COLUMNS] for d in input_dicts], dtype=np.float64)
+
+
+def sample_feature_matrix(n_samples, seed=0):
+    """Draw random raw feature rows uniformly from the StudentData ranges."""
+    rng = np.random.default_rng(seed)
+    return np.column_stack([
+        rng.integers(low, high + 1, size=n_samples)
+        for low, high in (FEATURE_RANGES[col] for col in FEATURE_COLUMNS)
+    ])
+
+
+class CompiledPreprocessor:
+    """
+    NumPy replacement for the fitted ColumnTransformer from d_t.py.
+
+    The passthrough columns and the one-hot slots of the categorical columns are
+    resolved once into index arrays, so transforming a request is a couple of
+    fancy-indexing operations instead of a DataFrame round trip through sklearn.
+    """
+
+    _ARRAYS = ('passthrough_src', 'passthrough_dst', 'onehot_src', 'onehot_dst', 'onehot_values')
+
+    def __init__(self, preprocessor):
+        from sklearn.preprocessing import FunctionTransformer, OneHotEncoder
+
+        input_index = {col: i for i, col in enumerate(FEATURE_COLUMNS)}
+        missing = [col for col in preprocessor.feature_names_in_ if col not in input_index]
+        if missing:
+            raise ValueError(f"Preprocessor expects unknown columns: {missing}")
+
+        passthrough_src, passthrough_dst = [], []
+        onehot_src, onehot_dst, onehot_values = [], [], []
+
+        for name, transformer, columns in preprocessor.transformers_:
+            if isinstance(transformer, str) and transformer == 'drop':
+                continue
+            output_slice = preprocessor.output_indices_[name]
+            if transformer == 'passthrough' or (
+                isinstance(transformer, FunctionTransformer) and transformer.func is None
+            ):
+                for offset, col in enumerate(columns):
+                    passthrough_src.append(input_index[col])
+                    passthrough_dst.append(output_slice.start + offset)
+            elif isinstance(transformer, OneHotEncoder):
+                if transformer.drop_idx_ is not None or getattr(transformer, 'infrequent_categories_', None):
+                    raise ValueError(f"Unsupported OneHotEncoder options in '{name}'")
+                slot = output_slice.start
+                for col, categories in zip(columns, transformer.categories_):
+                    for value in categories:
+                        onehot_src.append(input_index[col])
+                        onehot_dst.append(slot)
+                        onehot_values.append(float(value))
+                        slot += 1
+            else:
+                raise ValueError(f"Unsupported transformer '{name}': {transformer!r}")
+
+        self._set_arrays(
+            len(preprocessor.get_feature_names_out()),
+            passthrough_src=np.array(passthrough_src, dtype=np.intp),
+            passthrough_dst=np.array(passthrough_dst, dtype=np.intp),
+            onehot_src=np.array(onehot_src, dtype=np.intp),
+            onehot_dst=np.array(onehot_dst, dtype=np.intp),
+            onehot_values=np.array(onehot_values, dtype=np.float64),
+        )
+
+    def _set_arrays(self, n_features_out, **arrays):
+        self.n_features_out = n_features_out
+        for name in self._ARRAYS:
+            setattr(self, f'_{name}', arrays[name])
+        self._template = np.zeros((1, self.n_features_out), dtype=np.float64)
+
+    def to_arrays(self):
+        """The index arrays, keyed by name, for storing next to the compiled forest."""
+        return {name: getattr(self, f'_{name}') for name in self._ARRAYS}
+
+    @classmethod
+    def from_arrays(cls, n_features_out, arrays):
+        """Rebuild from ``to_arrays`` output without the fitted ColumnTransformer."""
+        compiled = cls.__new__(cls)
+        compiled._set_arrays(n_features_out, **arrays)
+        return compiled
+
+    def source_columns(self):
+        """Index into FEATURE_COLUMNS of the raw field behind every output column (-1 if none)."""
+        sources = np.full(self.n_features_out, -1, dtype=np.intp)
+        sources[self._passthrough_dst] = self._passthrough_src
+        sources[self._onehot_dst] = self._onehot_src
+        return sources
+
+    def transform_one(self, input_dict):
+        """Encode a single StudentData dict into a (1, n_features_out) row."""
+        raw = np.array([input_dict[col] for col in FEATURE_COLUMNS], dtype=np.float64)
+        row = self._template.copy()
+        row[0, self._passthrough_dst] = raw[self._passthrough_src]
+        # Unknown categories leave every slot at zero, like handle_unknown='ignore'
+        row[0, self._onehot_dst] = raw[self._onehot_src] == self._onehot_values
+        return row
+
+    def transform(self, X):
+        """Encode an (n, 15) raw feature matrix in FEATURE_COLUMNS order."""
+        X = np.asarray(X, dtype=np.float64)
+        out = np.zeros((X.shape[0], self.n_features_out), dtype=np.float64)
+        out[:, self._passthrough_dst] = X[:, self._passthrough_src]
+        out[:, self._onehot_dst] = X[:, self._onehot_src] == self._onehot_values
+        return out
+
+    def verify(self, preprocessor, n_samples=2000, seed=0):
+        """
+        Compare against the sklearn transform on random in-range inputs.
+        Returns the maximum absolute difference (0.0 means identical).
+        """
+        import pandas as pd
+
+        X = sample_feature_matrix(n_samples, seed)
+        expected = preprocessor.transform(pd.DataFrame(X, columns=FEATURE_COLUMNS))
+        if hasattr(expected, 'toarray'):
+            expected = expected.toarray()
+        expected = np.asarray(expected, dtype=np.float64)
+
+        batch_diff = np.abs(self.transform(X) - expected).max()
+        row_diff = max(
+            np.abs(self.transform_one(dict(zip(FEATURE_COLUMNS, X[i]))) - expected[i]).max()
+            for i in range(min(n_samples, 200))
+        )
+        return float(max(batch_diff, row_diff))
@@ -0,0 +1,177 @@
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+_ARRAYS = ('roots', 'feature', 'threshold', 'left', 'right', 'value', 'classes_')
+
+
+class CompiledForest:
+    """
+    Flattened, vectorized evaluator for a fitted RandomForestClassifier.
+
+    Every tree is copied into shared contiguous arrays (feature, threshold,
+    left/right child and leaf probabilities) with node ids offset per tree, so a
+    batch of rows is routed through all trees at once with NumPy fancy indexing
+    instead of sklearn's per-call validation and joblib dispatch.
+
+    Leaf values are taken as stored by sklearn >= 1.4, where they already hold
+    the per-leaf class fractions, and are summed tree by tree in estimator order
+    so the result is bit-for-bit identical to ``model.predict_proba``.
+    """
+
+    def __init__(self, model):
+        trees = [estimator.tree_ for estimator in model.estimators_]
+        n_classes = int(model.n_classes_)
+
+        offsets = np.cumsum([0] + [tree.node_count for tree in trees])
+        self.roots = offsets[:-1].astype(np.intp)
+        self.n_trees = len(trees)
+        self.n_features = int(model.n_features_in_)
+        self.classes_ = model.classes_
+
+        self.feature = np.concatenate([tree.feature for tree in trees]).astype(np.intp)
+        self.threshold = np.concatenate([tree.threshold for tree in trees]).astype(np.float64)
+        # Leaves keep -1 in the children arrays; they are never followed
+        self.left = np.concatenate([
+            np.where(tree.children_left >= 0, tree.children_left + offset, -1)
+            for tree, offset in zip(trees, offsets)
+        ]).astype(np.intp)
+        self.right = np.concatenate([
+            np.where(tree.children_right >= 0, tree.children_right + offset, -1)
+            for tree, offset in zip(trees, offsets)
+        ]).astype(np.intp)
+        self.value = np.ascontiguousarray(
+            np.concatenate([tree.value[:, 0, :n_classes] for tree in trees]), dtype=np.float64
+        )
+
+    @classmethod
+    def load(cls, directory, mmap_mode='r'):
+        """
+        Load arrays written by ``save``. With ``mmap_mode='r'`` the arrays are
+        read-only memory maps, so every process loading the same directory
+        shares one copy of the trees through the page cache.
+        """
+        with open(os.path.join(directory, 'meta.json')) as f:
+            meta = json.load(f)
+        forest = cls.__new__(cls)
+        for name in _ARRAYS:
+            setattr(forest, name, np.load(os.path.join(directory, f'{name}.npy'), mmap_mode=mmap_mode))
+        forest.n_trees = meta['n_trees']
+        forest.n_features = meta['n_features']
+        forest.meta = meta
+        forest.extra_arrays = {
+            name: np.load(os.path.join(directory, f'{name}.npy'), mmap_mode=mmap_mode)
+            for name in meta.get('extra_arrays', ())
+        }
+        return forest
+
+    def save(self, directory, extra_arrays=None, **meta):
+        """
+        Write the flattened arrays as uncompressed .npy files plus a meta.json.
+        Files are written to a staging directory that is renamed into place, so
+        readers never see a partially written artifact. ``extra_arrays`` are
+        stored alongside and come back as ``extra_arrays`` from ``load``.
+        """
+        extra_arrays = extra_arrays or {}
+        parent = os.path.dirname(os.path.abspath(directory))
+        staging = tempfile.mkdtemp(prefix='.compiled-', dir=parent)
+        try:
+            for name in _ARRAYS:
+                np.save(os.path.join(staging, f'{name}.npy'), np.asarray(getattr(self, name)))
+            for name, array in extra_arrays.items():
+                np.save(os.path.join(staging, f'{name}.npy'), np.asarray(array))
+            with open(os.path.join(staging, 'meta.json'), 'w') as f:
+                json.dump({'n_trees': self.n_trees, 'n_features': self.n_features,
+                           'extra_arrays': sorted(extra_arrays), **meta}, f)
+            previous = None
+            if os.path.isdir(directory):
+                previous = tempfile.mkdtemp(prefix='.previous-', dir=parent)
+                os.replace(directory, os.path.join(previous, 'artifact'))
+            os.replace(staging, directory)
+            if previous is not None:
+                shutil.rmtree(previous, ignore_errors=True)
+        except Exception:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+
+    @property
+    def nbytes(self):
+        return sum(a.nbytes for a in (self.feature, self.threshold, self.left, self.right, self.value))
+
+    def apply(self, X):
+        """Return the global leaf id reached by every row in every tree, shape (n_trees, n_rows)."""
+        # sklearn compares float32 inputs against float64 thresholds
+        X = np.asarray(X, dtype=np.float32)
+        n_rows = X.shape[0]
+
+        rows = np.tile(np.arange(n_rows, dtype=np.intp), self.n_trees)
+        nodes = np.repeat(self.roots, n_rows)
+        pending = np.arange(nodes.size, dtype=np.intp)
+        leaves = np.empty(nodes.size, dtype=np.intp)
+
+        # Advance every (tree, row) pair one level per iteration, dropping pairs
+        # as soon as they reach a leaf
+        while pending.size:
+            features = self.feature[nodes]
+            at_leaf = features < 0
+            if at_leaf.any():
+                leaves[pending[at_leaf]] = nodes[at_leaf]
+                inner = ~at_leaf
+                pending, nodes, features = pending[inner], nodes[inner], features[inner]
+            go_left = X[rows[pending], features] <= self.threshold[nodes]
+            nodes = np.where(go_left, self.left[nodes], self.right[nodes])
+
+        return leaves.reshape(self.n_trees, n_rows)
+
+    def predict_proba(self, X):
+        leaves = self.apply(X)
+        proba = np.zeros((leaves.shape[1], self.value.shape[1]), dtype=np.float64)
+        for tree_leaves in leaves:
+            proba += self.value[tree_leaves]
+        proba /= self.n_trees
+        return proba
+
+    def predict(self, X):
+        return self.classes_.take(self.predict_proba(X).argmax(axis=1))
+
+    def contributions(self, X):
+        """
+        Decompose ``predict_proba(X)`` along the decision paths (tree
+        interpreter): every split a row passes through moves its class
+        distribution from the parent node's value to the child's, and that
+        change is credited to the split feature. Averaged over the trees,
+
+            predict_proba(X) == bias + contributions.sum(axis=1)
+
+        up to float rounding. Returns ``bias`` with shape (n_classes,), the
+        mean root distribution, and ``contributions`` with shape (n_rows,
+        n_features, n_classes). All paths are walked together one level per
+        iteration, like ``apply``.
+        """
+        X = np.asarray(X, dtype=np.float32)
+        n_rows = X.shape[0]
+        n_classes = self.value.shape[1]
+
+        rows = np.tile(np.arange(n_rows, dtype=np.intp), self.n_trees)
+        nodes = np.repeat(self.roots, n_rows)
+        totals = np.zeros((n_classes, n_rows * self.n_features), dtype=np.float64)
+
+        while nodes.size:
+            features = self.feature[nodes]
+            inner = features >= 0
+            rows, nodes, features = rows[inner], nodes[inner], features[inner]
+            go_left = X[rows, features] <= self.threshold[nodes]
+            children = np.where(go_left, self.left[nodes], self.right[nodes])
+            change = self.value[children] - self.value[nodes]
+            # One bincount per class sums the changes per (row, feature) slot
+            slots = rows * self.n_features + features
+            for k in range(n_classes):
+                totals[k] += np.bincount(slots, weights=change[:, k], minlength=totals.shape[1])
+            nodes = children
+
+        bias = self.value[self.roots].mean(axis=0)
+        contributions = (totals / self.n_trees).T.reshape(n_rows, self.n_features, n_classes)
+        return bias, contributions
@@ -0,0 +1,55 @@
+"""
+Process-pool offload for forest inference.
+
+Worker processes only import this module, never main.py. Each worker maps the
+compiled forest from its artifact directory read-only, so all workers share the
+same physical pages for the tree arrays. The sklearn model is only unpickled in
+a worker if no compiled forest is available or a batch is too large for the
+compiled engine to be faster; with ``max_compiled_rows=None`` (shared mode)
+every batch stays on the mapped forest, so workers never hold a private copy.
+"""
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+_forest = None
+_model = None
+_model_path = None
+_max_compiled_rows = 0
+
+
+def _init_worker(compiled_dir, model_path, max_compiled_rows):
+    global _forest, _model_path, _max_compiled_rows
+    _model_path = model_path
+    _max_compiled_rows = max_compiled_rows
+    if compiled_dir is not None:
+        from forest_engine import CompiledForest
+        _forest = CompiledForest.load(compiled_dir, mmap_mode='r')
+
+
+def _predict_proba(X):
+    global _model
+    if _forest is not None and (_max_compiled_rows is None or X.shape[0] <= _max_compiled_rows):
+        return _forest.predict_proba(X)
+    if _model is None:
+        import joblib
+        _model = joblib.load(_model_path)
+    return _model.predict_proba(X)
+
+
+def create_pool(max_workers, compiled_dir=None, model_path='model.pkl', max_compiled_rows=64):
+    """
+    Start a pool whose workers evaluate the forest from ``compiled_dir`` (or
+    ``model_path``); batches over ``max_compiled_rows`` rows go to sklearn
+    unless it is None.
+    """
+    # spawn keeps the workers free of the parent's event loop and Mongo client threads
+    return ProcessPoolExecutor(
+        max_workers=max_workers,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=_init_worker,
+        initargs=(compiled_dir, model_path, max_compiled_rows),
+    )
+
+
+async def predict_proba_in_pool(loop, pool, X):
+    return await loop.run_in_executor(pool, _predict_proba, X)
@@ -0,0 +1,211 @@
+"""
+Precomputed forest outputs for the most frequent StudentData vectors.
+
+Every field of StudentData is a small bounded integer, so a feature vector
+packs losslessly into one int64 (mixed radix over FEATURE_RANGES). The table
+stores the sorted packed keys with the model's probabilities for each of them;
+at serving time a dict maps a key to its row, so a matching request is a hash
+lookup instead of preprocessing plus a walk through every tree. Anything not
+in the table falls back to the model.
+
+Build it offline for the serving model from the most frequent vectors in the
+predictions collection and/or the training CSV:
+
+    python lookup_table.py --top 100000 --source both
+"""
+import argparse
+import datetime
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+import numpy as np
+
+from features import FEATURE_COLUMNS, FEATURE_RANGES
+
+_LOWS = [FEATURE_RANGES[column][0] for column in FEATURE_COLUMNS]
+_RADICES = [FEATURE_RANGES[column][1] - FEATURE_RANGES[column][0] + 1 for column in FEATURE_COLUMNS]
+# Stride of each field in the packed key; the product of all radices is < 2**63
+_STRIDES = [int(np.prod(_RADICES[i + 1:], dtype=np.int64)) for i in range(len(_RADICES))]
+
+
+def encode_key(values):
+    """Pack one feature tuple (FEATURE_COLUMNS order) into an int; None if a value is out of range."""
+    key = 0
+    for value, low, radix, stride in zip(values, _LOWS, _RADICES, _STRIDES):
+        offset = value - low
+        if not 0 <= offset < radix:
+            return None
+        key += offset * stride
+    return key
+
+
+def encode_keys(X):
+    """Vectorised ``encode_key`` for an (n, 15) integer matrix of in-range rows."""
+    return (np.asarray(X, dtype=np.int64) - np.asarray(_LOWS, dtype=np.int64)) @ np.asarray(_STRIDES, dtype=np.int64)
+
+
+class LookupTable:
+    """Exact-match table of precomputed class probabilities with hit/miss counters."""
+
+    def __init__(self, keys, proba, counts=None, meta=None):
+        self.keys = keys
+        self.proba = proba
+        self.counts = counts
+        self.meta = meta or {}
+        self._index = dict(zip(keys.tolist(), range(len(keys))))
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def build(cls, model, preprocessor, X, counts=None):
+        """
+        Evaluate ``model`` once for every distinct row of the raw feature
+        matrix ``X``. ``counts`` (how often each row was seen) is kept for
+        reporting the share of traffic the table covers.
+        """
+        import pandas as pd
+
+        keys, first, inverse = np.unique(encode_keys(X), return_index=True, return_inverse=True)
+        if counts is not None:
+            counts = np.bincount(inverse.ravel(), weights=counts, minlength=len(keys)).astype(np.int64)
+        rows = pd.DataFrame(np.asarray(X)[first], columns=FEATURE_COLUMNS)
+        proba = model.predict_proba(preprocessor.transform(rows))
+        return cls(keys, np.ascontiguousarray(proba, dtype=np.float64), counts)
+
+    @classmethod
+    def load(cls, directory, mmap_mode='r'):
+        with open(os.path.join(directory, 'meta.json')) as f:
+            meta = json.load(f)
+        arrays = {
+            name: np.load(os.path.join(directory, f'{name}.npy'), mmap_mode=mmap_mode)
+            for name in ('keys', 'proba', 'counts') if os.path.exists(os.path.join(directory, f'{name}.npy'))
+        }
+        return cls(arrays['keys'], arrays['proba'], arrays.get('counts'), meta)
+
+    def save(self, directory, **meta):
+        """Write the arrays and meta.json through a staging directory that is renamed into place."""
+        parent = os.path.dirname(os.path.abspath(directory))
+        staging = tempfile.mkdtemp(prefix='.lookup-', dir=parent)
+        try:
+            np.save(os.path.join(staging, 'keys.npy'), self.keys)
+            np.save(os.path.join(staging, 'proba.npy'), self.proba)
+            if self.counts is not None:
+                np.save(os.path.join(staging, 'counts.npy'), self.counts)
+            with open(os.path.join(staging, 'meta.json'), 'w') as f:
+                json.dump({'entries': len(self.keys), **meta}, f)
+            if os.path.isdir(directory):
+                shutil.rmtree(directory)
+            os.replace(staging, directory)
+        except Exception:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+
+    def get(self, values):
+        """Probabilities for a feature tuple, or None when it is not in the table."""
+        key = encode_key(values)
+        row = self._index.get(key) if key is not None else None
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return self.proba[row]
+
+    def __len__(self):
+        return len(self.keys)
+
+    @property
+    def nbytes(self):
+        """Arrays plus the in-memory index (dict slots and the int key objects)."""
+        arrays = sum(a.nbytes for a in (self.keys, self.proba, self.counts) if a is not None)
+        return arrays + sys.getsizeof(self._index) + sum(sys.getsizeof(key) for key in self._index)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.keys),
+            "memory_bytes": self.nbytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "built_at": self.meta.get("built_at"),
+            "coverage": self.meta.get("coverage"),
+        }
+
+
+def frequent_prediction_vectors(mongodb_url, database_name, top):
+    """The ``top`` most frequent user_data vectors in the predictions collection, their counts and the total."""
+    from pymongo import MongoClient
+
+    collection = MongoClient(mongodb_url, serverSelectionTimeoutMS=5000)[database_name]["predictions"]
+    rows = list(collection.aggregate([
+        {"$group": {"_id": [f"$user_data.{column}" for column in FEATURE_COLUMNS], "count": {"$sum": 1}}},
+        {"$sort": {"count": -1}},
+        {"$limit": top},
+    ], allowDiskUse=True))
+    return np.array([row["_id"] for row in rows], dtype=np.int64).reshape(-1, len(FEATURE_COLUMNS)), \
+        np.array([row["count"] for row in rows], dtype=np.int64), collection.estimated_document_count()
+
+
+def frequent_csv_vectors(top):
+    from dataset import load_features_and_target
+
+    X, _ = load_features_and_target()
+    keys, first, counts = np.unique(encode_keys(X.to_numpy()), return_index=True, return_counts=True)
+    order = np.argsort(-counts, kind='stable')[:top]
+    return X.to_numpy()[first[order]].astype(np.int64), counts[order], len(X)
+
+
+def main():
+    import joblib
+
+    import model_registry
+    from serving import file_fingerprint
+
+    parser = argparse.ArgumentParser(description="Build the lookup table for the serving model.")
+    parser.add_argument('--top', type=int, default=100000, help="Number of most frequent vectors to precompute")
+    parser.add_argument('--source', choices=('predictions', 'csv', 'both'), default='both')
+    parser.add_argument('--registry', type=str, default='models', help="Model registry directory")
+    parser.add_argument('--version', type=str, default=None, help="Registry version (default: CURRENT, else model.pkl)")
+    parser.add_argument('--output', type=str, default='model_lookup', help="Directory for the local model's table")
+    args = parser.parse_args()
+
+    version = args.version or model_registry.current_version(args.registry)
+    if version is not None:
+        model_path, preprocessor_path = model_registry.version_paths(args.registry, version)
+        output = os.path.join(model_registry.version_dir(args.registry, version), 'lookup')
+    else:
+        model_path, preprocessor_path, output = 'model.pkl', 'preprocessor.pkl', args.output
+
+    sources = []
+    if args.source in ('predictions', 'both'):
+        try:
+            sources.append(frequent_prediction_vectors(
+                os.getenv("MONGODB_URL", "mongodb://localhost:27017"), "admin", args.top))
+        except Exception as e:
+            print(f"❌ Could not read predictions from MongoDB ({e})")
+    if args.source in ('csv', 'both'):
+        sources.append(frequent_csv_vectors(args.top))
+    if not sources:
+        sys.exit("No source vectors available.")
+
+    X = np.vstack([vectors for vectors, _, _ in sources])
+    counts = np.concatenate([counts for _, counts, _ in sources])
+    # Keep the most frequent distinct vectors across all sources
+    keys, inverse = np.unique(encode_keys(X), return_inverse=True)
+    totals = np.bincount(inverse.ravel(), weights=counts)
+    selected = np.isin(inverse.ravel(), np.argsort(-totals, kind='stable')[:args.top])
+
+    table = LookupTable.build(joblib.load(model_path), joblib.load(preprocessor_path), X[selected], counts[selected])
+    # Share of all observed requests/rows that the table answers
+    coverage = round(float(table.counts.sum() / sum(total for _, _, total in sources)), 4)
+    table.save(output, source=file_fingerprint(model_path), built_at=datetime.datetime.utcnow().isoformat(),
+               sources=args.source, coverage=coverage)
+    print(f"✅ Lookup table with {len(table)} entries ({table.nbytes / 1e6:.1f} MB in memory) "
+          f"covering {coverage:.1%} of the observed rows written to '{output}'")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,26 +1,264 @@
-import joblib
-import pandas as pd
-from fastapi import FastAPI, HTTPException, Request
+import time
+# Reported in the startup profile: how long importing this module took
+_import_started = time.perf_counter()
+
+from fastapi import Depends, FastAPI, Header, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.exceptions import RequestValidationError
-from fastapi.responses import JSONResponse
-from pydantic import BaseModel, ValidationError, Field
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from pydantic import BaseModel, TypeAdapter, ValidationError, Field
+from pydantic_core import from_json
+from typing import List, Optional
 from motor.motor_asyncio import AsyncIOMotorClient
+import asyncio
+import csv
 import datetime
+import hmac
+import io
+import json
+import logging
+import os
 import uuid
 from bson import ObjectId
+from typing import Dict
+from circuit_breaker import CircuitBreaker, CircuitOpenError
+from app_logging import SampledLogger, configure_logging, log
+from features import FEATURE_COLUMNS, STYLE_NAMES, feature_key, sample_feature_matrix
+import model_registry
+from pagination import encode_cursor, keyset_filter, parse_learning_style, parse_projection
+from inference_pool import create_pool, predict_proba_in_pool
+from metrics import CONTENT_TYPE, MetricsRegistry
+from micro_batcher import MicroBatcher
+from model_experiments import ExperimentRouter, parse_weights
+from prediction_cache import PredictionCache
+from retention import ROLLUPS_COLLECTION, RetentionJob, bucket_row, raw_buckets, read_watermark, rollup_buckets
+from write_behind import WriteBehindQueue
+from wire_format import (
+    FEATURES_MEDIA_TYPE, PROBABILITIES_MEDIA_TYPE, FastJSONResponse, decode_features,
+    encode_probabilities, is_packed_request, wants_packed_response,
+)
+
+# Timings of each startup phase, logged once the model is ready and shown in /health
+startup_profile = {"import_ms": round((time.perf_counter() - _import_started) * 1000, 1)}
+
+# --- 0. Logging ---
+# Structured (JSON by default) and leveled; warnings that can fire on every
+# request are sampled to one record per LOG_SAMPLE_INTERVAL seconds.
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")  # "json" or "text"
+LOG_SAMPLE_INTERVAL = float(os.getenv("LOG_SAMPLE_INTERVAL", "10"))
+configure_logging(LOG_LEVEL, LOG_FORMAT)
+logger = logging.getLogger("learning_style_api")
+sampled_logger = SampledLogger(logger, LOG_SAMPLE_INTERVAL)
 
 # --- 1. Load the trained ML model and preprocessor ---
-try:
-    model = joblib.load('model.pkl')
-    preprocessor = joblib.load('preprocessor.pkl')
-except FileNotFoundError:
-    raise RuntimeError("Model and preprocessor files not found. Have you run model training?")
+# Models are served from a versioned registry written by d_t.py (models/CURRENT
+# names the active version). Without a registry the plain model.pkl and
+# preprocessor.pkl in the working directory are served as version "local".
+MODEL_PATH = 'model.pkl'
+PREPROCESSOR_PATH = 'preprocessor.pkl'
+MODEL_REGISTRY_DIR = os.getenv("MODEL_REGISTRY_DIR", "models")
+# Seconds between checks of the registry's CURRENT pointer (0 disables the watcher)
+MODEL_WATCH_INTERVAL = float(os.getenv("MODEL_WATCH_INTERVAL", "10"))
+
+# "compiled" evaluates flattened tree arrays with NumPy, "sklearn" calls the
+# model directly. The compiled engine is only used if it reproduces
+# model.predict_proba exactly on a random sample of inputs. Its advantage is
+# the missing per-call overhead, so larger batches still go to sklearn's
+# Cython traversal, which wins above a few dozen rows.
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "compiled")
+COMPILED_MAX_ROWS = int(os.getenv("COMPILED_MAX_ROWS", "64"))
+
+# The verified compiled forest and preprocessor are written as uncompressed
+# .npy files next to the model ("compiled" in the version directory, or
+# COMPILED_MODEL_DIR for the local model) by training or by the first start;
+# later starts load those arrays instead of unpickling and recompiling.
+# Shared loading memory-maps them read-only, so every worker shares one copy
+# and never unpickles model.pkl. Requires the compiled backend.
+SHARED_MODEL = os.getenv("SHARED_MODEL", "false").lower() == "true"
+COMPILED_MODEL_DIR = os.getenv("COMPILED_MODEL_DIR", "model_compiled")
+# Number of processes that run inference off the event loop (0 = inline)
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", "0"))
+# Batches of more than BATCH_OFFLOAD_ROWS rows are preprocessed (and, without
+# inference workers, evaluated) in a worker thread instead of on the event loop
+BATCH_OFFLOAD_ROWS = int(os.getenv("BATCH_OFFLOAD_ROWS", "256"))
+
+# Precomputed probabilities for the most frequent feature vectors, built
+# offline by lookup_table.py (in the version's "lookup" directory, or
+# LOOKUP_TABLE_DIR for the local model). Matching requests skip the forest.
+LOOKUP_TABLE_ENABLED = os.getenv("LOOKUP_TABLE_ENABLED", "true").lower() == "true"
+LOOKUP_TABLE_DIR = os.getenv("LOOKUP_TABLE_DIR", "model_lookup")
+
+
+# "background" starts answering liveness probes (/ and /health) immediately
+# and loads the model once the server is up; /ready and the prediction
+# endpoints return 503 until it is loaded. "blocking" loads it during startup,
+# before the server accepts connections.
+MODEL_LOAD_MODE = os.getenv("MODEL_LOAD_MODE", "background")
+
+
+def load_model_version(version=None):
+    """Load a registry version (the CURRENT one by default), falling back to the local files."""
+    from serving import load_serving_model
+
+    if version is None:
+        version = model_registry.current_version(MODEL_REGISTRY_DIR)
+    if version is not None:
+        model_path, preprocessor_path = model_registry.version_paths(MODEL_REGISTRY_DIR, version)
+        compiled_dir = os.path.join(model_registry.version_dir(MODEL_REGISTRY_DIR, version), "compiled")
+        lookup_dir = os.path.join(model_registry.version_dir(MODEL_REGISTRY_DIR, version), "lookup")
+        metadata = next((v for v in model_registry.list_versions(MODEL_REGISTRY_DIR) if v["version"] == version), {})
+    else:
+        version, model_path, preprocessor_path, compiled_dir, lookup_dir, metadata = \
+            "local", MODEL_PATH, PREPROCESSOR_PATH, COMPILED_MODEL_DIR, LOOKUP_TABLE_DIR, {}
+
+    return load_serving_model(
+        version, model_path, preprocessor_path,
+        backend=INFERENCE_BACKEND,
+        compiled_dir=compiled_dir,
+        shared=SHARED_MODEL,
+        persist_compiled=True,
+        compiled_max_rows=COMPILED_MAX_ROWS,
+        metadata=metadata,
+        lookup_dir=lookup_dir if LOOKUP_TABLE_ENABLED else None,
+    )
+
+
+# Replaced as a whole on hot reload; requests read it once and keep using the
+# version they started with. None until the startup load has finished.
+active_model = None
+model_load_state = {"status": "loading", "error": None}
+
+
+def active_version():
+    return active_model.version if active_model is not None else None
+
+
+def require_model():
+    """Readiness gate for the prediction endpoints."""
+    if active_model is None:
+        raise HTTPException(
+            status_code=503,
+            detail="Model failed to load" if model_load_state["status"] == "failed" else "Model is still loading",
+            headers={"Retry-After": "5"},
+        )
+
+
+async def predict_proba_async(serving, processed_input, in_thread=False):
+    """Run inference in the process pool when one is serving this version, else inline or in a worker thread."""
+    loop = asyncio.get_running_loop()
+    pool = getattr(app, 'inference_pool', None)
+    if pool is None or app.inference_pool_version != serving.version:
+        if in_thread:
+            return await loop.run_in_executor(None, serving.predict_proba, processed_input)
+        return serving.predict_proba(processed_input)
+    return await predict_proba_in_pool(loop, pool, processed_input)
+
+# --- 1.3. Prediction cache ---
+# Identical profiles are answered from an LRU/TTL cache keyed on the model
+# version and the feature tuple, so a model swap needs no invalidation.
+PREDICTION_CACHE_SIZE = int(os.getenv("PREDICTION_CACHE_SIZE", "10000"))  # 0 disables the cache
+PREDICTION_CACHE_TTL = float(os.getenv("PREDICTION_CACHE_TTL", "3600"))
+prediction_cache = PredictionCache(maxsize=PREDICTION_CACHE_SIZE, ttl=PREDICTION_CACHE_TTL)
+
+
+async def predict_rows(serving, input_dicts, timings=None):
+    """Preprocess and evaluate the forest once for all rows; returns (probabilities, prediction_value) per row."""
+    offload = len(input_dicts) > BATCH_OFFLOAD_ROWS
+    preprocess_started = time.perf_counter()
+    if len(input_dicts) == 1:
+        processed_input = serving.preprocess_one(input_dicts[0])
+    elif offload:
+        processed_input = await asyncio.get_running_loop().run_in_executor(None, serving.preprocess_many, input_dicts)
+    else:
+        processed_input = serving.preprocess_many(input_dicts)
+    inference_started = time.perf_counter()
+    # Evaluate the forest once; the predicted class is the most probable one
+    prediction_proba = await predict_proba_async(serving, processed_input, in_thread=offload)
+    prediction_values = serving.classes_.take(prediction_proba.argmax(axis=1))
+    if timings is not None:
+        timings["preprocess"] = (inference_started - preprocess_started) * 1000
+        timings["inference"] = (time.perf_counter() - inference_started) * 1000
+    return list(zip(prediction_proba, prediction_values.tolist()))
+
+
+async def predict_cached(input_dicts, timings=None, serving=None):
+    """
+    Return the serving model version and (probabilities, prediction_value) for
+    every input, evaluating the preprocessor and forest only for the cache
+    misses. ``serving`` defaults to the active model. Single-row misses are
+    coalesced with concurrent requests by the micro-batcher when it runs.
+    Stage durations in milliseconds are added to ``timings`` when given.
+    """
+    started = time.perf_counter()
+    serving = serving or active_model
+    # Keys include the version so results of a replaced model are never served
+    keys = [(serving.version, feature_key(input_dict)) for input_dict in input_dicts]
+    results = [prediction_cache.get(key) for key in keys]
+    missing = [i for i, result in enumerate(results) if result is None]
+    if missing and serving.lookup is not None:
+        lookup_started = time.perf_counter()
+        still_missing = []
+        for i in missing:
+            probabilities = serving.lookup.get(keys[i][1])
+            if probabilities is None:
+                still_missing.append(i)
+                continue
+            results[i] = (probabilities, int(serving.classes_[probabilities.argmax()]))
+            prediction_cache.put(keys[i], results[i])
+        missing = still_missing
+        if timings is not None:
+            timings["lookup"] = (time.perf_counter() - lookup_started) * 1000
+    if missing:
+        batcher = getattr(app, 'micro_batcher', None)
+        if len(input_dicts) == 1 and batcher is not None:
+            inference_started = time.perf_counter()
+            computed = [await batcher.submit(serving, input_dicts[0], timings)]
+            if timings is not None:
+                # Includes the wait for the batch to fill and its shared preprocessing;
+                # batch_share is this row's part of the evaluation alone
+                timings["batched_inference"] = (time.perf_counter() - inference_started) * 1000
+        else:
+            computed = await predict_rows(serving, [input_dicts[i] for i in missing], timings)
+        for i, (probabilities, prediction) in zip(missing, computed):
+            probabilities.setflags(write=False)
+            results[i] = (probabilities, prediction)
+            prediction_cache.put(keys[i], results[i])
+    if timings is not None:
+        timings["cache"] = (time.perf_counter() - started) * 1000 - \
+            sum(timings.get(stage, 0.0) for stage in ("lookup", "preprocess", "inference", "batched_inference"))
+    return serving.version, results
 
 # --- 2. MongoDB Configuration ---
-MONGODB_URL = "mongodb://localhost:27017"
+MONGODB_URL = os.getenv("MONGODB_URL", "mongodb://localhost:27017")
 DATABASE_NAME = "admin"
 
+# Connection pool and timeouts. Server selection fails fast so a prediction
+# never waits the driver's default 30 seconds when MongoDB is down.
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "50"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "2000"))
+MONGO_CONNECT_TIMEOUT_MS = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "2000"))
+MONGO_SOCKET_TIMEOUT_MS = int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", "10000"))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "1000"))
+
+# After MONGO_BREAKER_FAILURES consecutive connection failures, persistence and
+# reads are skipped for MONGO_BREAKER_COOLDOWN seconds before a trial call.
+MONGO_BREAKER_FAILURES = int(os.getenv("MONGO_BREAKER_FAILURES", "5"))
+MONGO_BREAKER_COOLDOWN = float(os.getenv("MONGO_BREAKER_COOLDOWN", "30"))
+# Seconds between background pings; /health reports the last result
+MONGO_HEALTH_INTERVAL = float(os.getenv("MONGO_HEALTH_INTERVAL", "10"))
+
+mongo_breaker = CircuitBreaker(MONGO_BREAKER_FAILURES, MONGO_BREAKER_COOLDOWN)
+
+# Write-behind persistence: predictions are buffered and flushed with
+# insert_many by a background task instead of awaiting insert_one per request.
+WRITE_BEHIND_ENABLED = os.getenv("WRITE_BEHIND_ENABLED", "true").lower() == "true"
+WRITE_BEHIND_BATCH_SIZE = int(os.getenv("WRITE_BEHIND_BATCH_SIZE", "500"))
+WRITE_BEHIND_FLUSH_INTERVAL = float(os.getenv("WRITE_BEHIND_FLUSH_INTERVAL", "0.2"))
+WRITE_BEHIND_MAX_PENDING = int(os.getenv("WRITE_BEHIND_MAX_PENDING", "10000"))
+WRITE_BEHIND_POLICY = os.getenv("WRITE_BEHIND_POLICY", "drop")  # "drop" or "block"
+
 # --- 3. Initialize FastAPI ---
 app = FastAPI(
     title="Implicit Learning Style Detection API",
@@ -34,32 +272,503 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing", "X-Model-Version"],
 )
 
-# --- 5. MongoDB Connection Events ---
+# --- 4.1. Per-stage timing breakdown and request metrics ---
+metrics = MetricsRegistry()
+HTTP_REQUESTS = metrics.counter("http_requests_total", "HTTP requests by route and status", ("method", "route", "status"))
+HTTP_LATENCY = metrics.histogram("http_request_duration_seconds", "HTTP request latency", ("method", "route"))
+STAGE_LATENCY = metrics.histogram("request_stage_duration_seconds", "Latency of each request stage", ("route", "stage"))
+MONGO_WRITE_LATENCY = metrics.histogram("mongo_write_duration_seconds", "Latency of MongoDB writes", ("operation",))
+PREDICTIONS = metrics.counter("predictions_total", "Rows predicted by model version", ("model_version",))
+PREDICTIONS_NOT_SAVED = metrics.counter("predictions_not_saved_total", "Predictions that were not persisted", ("reason",))
+MICRO_BATCH_SIZE = metrics.histogram("micro_batch_size", "Rows per coalesced inference call",
+                                     buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256))
+MICRO_BATCH_LATENCY = metrics.histogram("micro_batch_duration_seconds", "Latency of coalesced inference calls")
+
+
+def record_request_metrics(scope, state, status):
+    # Label by route template so /predictions/{prediction_id} is a single series
+    route = scope.get("route")
+    route = getattr(route, "path", "unmatched")
+    method = scope["method"]
+    HTTP_REQUESTS.inc(method=method, route=route, status=status)
+    HTTP_LATENCY.observe(time.perf_counter() - state["request_started"], method=method, route=route)
+    for stage, ms in state["timings"].items():
+        STAGE_LATENCY.observe(ms / 1000, route=route, stage=stage)
+
+
+class StageTimingMiddleware:
+    """
+    Reports the per-stage latency recorded by a handler in a Server-Timing
+    response header. Body parsing and validation are measured from request
+    arrival to handler entry, serialization from handler exit to response start.
+    Request counts and latencies are recorded in the metrics registry once the
+    response has been sent.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        state = scope.setdefault("state", {})
+        state["request_started"] = time.perf_counter()
+        state["timings"] = {}
+        response = {"status": 500}
+
+        async def send_with_timings(message):
+            timings = state["timings"]
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+                if timings:
+                    if "handler_finished" in state:
+                        timings["serialization"] = (time.perf_counter() - state["handler_finished"]) * 1000
+                    header = ", ".join(f"{stage};dur={ms:.3f}" for stage, ms in timings.items())
+                    message.setdefault("headers", []).append((b"server-timing", header.encode("latin-1")))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timings)
+        finally:
+            record_request_metrics(scope, state, response["status"])
+
+
+app.add_middleware(StageTimingMiddleware)
+
+
+def record_stage(request: Request, stage: str, started: float) -> float:
+    """Store the elapsed milliseconds for a stage and return the new start mark."""
+    now = time.perf_counter()
+    request.state.timings[stage] = (now - started) * 1000
+    return now
+
+
+def format_prediction(probabilities, prediction_value):
+    # Map numeric prediction to a readable name for frontend display and
+    # build the percentages for each learning style
+    return {
+        "predicted_style": STYLE_NAMES[prediction_value],
+        "predictions": [
+            {
+                "style": style_name,
+                "percentage": round(float(probabilities[idx]) * 100, 2),
+                "is_predicted": idx == prediction_value
+            }
+            for idx, style_name in enumerate(STYLE_NAMES)
+        ]
+    }
+
+# --- 4.2. Inference process pool ---
+async def start_pool_for(serving):
+    """Start a pool whose workers serve ``serving`` and warm every worker up."""
+    # Shared workers answer every batch from the mapped forest, like ServingModel
+    # without its sklearn model, instead of each unpickling model.pkl
+    max_compiled_rows = None if serving.shared else COMPILED_MAX_ROWS
+    pool = create_pool(INFERENCE_WORKERS, serving.compiled_dir, serving.model_path, max_compiled_rows)
+    warmup = serving.preprocess_one(dict(zip(FEATURE_COLUMNS, sample_feature_matrix(1)[0])))
+    loop = asyncio.get_running_loop()
+    await asyncio.gather(*(predict_proba_in_pool(loop, pool, warmup) for _ in range(INFERENCE_WORKERS)))
+    return pool
+
+
+@app.on_event("shutdown")
+async def stop_inference_pool():
+    if getattr(app, 'inference_pool', None) is not None:
+        app.inference_pool.shutdown(wait=False, cancel_futures=True)
+        app.inference_pool = None
+
+# --- 4.3. Model hot reload ---
+model_swap_lock = asyncio.Lock()
+
+
+async def activate_model_version(version=None, set_current=False):
+    """
+    Load a version in a worker thread, warm it up (and a process pool for it),
+    then swap it in with a single reference assignment. Requests already in
+    flight finish on the version they started with. With ``set_current`` the
+    registry's CURRENT pointer is moved to it only once it is serving, so a
+    version that fails to load is never left as CURRENT.
+    """
+    global active_model
+    async with model_swap_lock:
+        loop = asyncio.get_running_loop()
+        serving = await loop.run_in_executor(None, load_model_version, version)
+        await loop.run_in_executor(None, serving.warm_up)
+        if keeps_sklearn_model():
+            await loop.run_in_executor(None, serving.load_model)
+
+        new_pool = await start_pool_for(serving) if INFERENCE_WORKERS > 0 else None
+        old_pool = getattr(app, 'inference_pool', None)
+
+        if set_current:
+            model_registry.set_current_version(MODEL_REGISTRY_DIR, serving.version)
+        previous = active_version()
+        active_model = serving
+        model_load_state.update(status="ready", error=None)
+        if new_pool is not None:
+            app.inference_pool, app.inference_pool_version = new_pool, serving.version
+        if old_pool is not None:
+            old_pool.shutdown(wait=False)
+        log(logger, logging.INFO, "Model version replaced", previous=previous, version=serving.version)
+        return serving
+
+
+async def watch_model_registry():
+    """Poll the registry's CURRENT pointer and hot-reload when it changes."""
+    while True:
+        await asyncio.sleep(MODEL_WATCH_INTERVAL)
+        try:
+            current = model_registry.current_version(MODEL_REGISTRY_DIR)
+            if current is not None and active_model is not None and current != active_model.version:
+                await activate_model_version(current)
+        except Exception as e:
+            log(logger, logging.ERROR, "Model reload failed", error=str(e))
+
+
 @app.on_event("startup")
-async def startup_db_client():
+async def start_model_watcher():
+    if MODEL_WATCH_INTERVAL > 0:
+        app.model_watcher = asyncio.create_task(watch_model_registry())
+
+@app.on_event("shutdown")
+async def stop_model_watcher():
+    if getattr(app, 'model_watcher', None) is not None:
+        app.model_watcher.cancel()
+
+# --- 4.4. Shadow and A/B evaluation ---
+# AB_WEIGHTS sends a share of live traffic to other registry versions
+# ("<version>=0.1,<version>=0.05"); the active version answers the rest.
+# SHADOW_VERSION additionally evaluates SHADOW_FRACTION of /predict-style
+# requests off the request path and compares its answer with the one returned.
+AB_WEIGHTS = parse_weights(os.getenv("AB_WEIGHTS", ""))
+SHADOW_VERSION = os.getenv("SHADOW_VERSION") or None
+SHADOW_FRACTION = float(os.getenv("SHADOW_FRACTION", "0.1"))
+SHADOW_MAX_PENDING = int(os.getenv("SHADOW_MAX_PENDING", "64"))
+
+experiment_router = ExperimentRouter(AB_WEIGHTS, SHADOW_VERSION, SHADOW_FRACTION, SHADOW_MAX_PENDING)
+experiment_models = {}  # version -> ServingModel for the A/B and shadow versions
+shadow_tasks = set()
+
+
+async def load_experiment_models(versions):
+    """Load and warm up each of ``versions`` that isn't loaded yet or the active one."""
+    loop = asyncio.get_running_loop()
+    for version in set(versions) - set(experiment_models) - {active_version()}:
+        serving = await loop.run_in_executor(None, load_model_version, version)
+        await loop.run_in_executor(None, serving.warm_up)
+        experiment_models[version] = serving
+        log(logger, logging.INFO, "Loaded model version for evaluation", version=version)
+
+
+def route_request():
+    """The serving model for the next request according to the A/B weights."""
+    version = experiment_router.choose(active_model.version)
+    return experiment_models.get(version, active_model)
+
+
+def shadow_predict(serving, input_dict):
+    started = time.perf_counter()
+    probabilities = serving.predict_proba(serving.preprocess_one(input_dict))
+    prediction_value = int(serving.classes_.take(probabilities.argmax(axis=1))[0])
+    return prediction_value, (time.perf_counter() - started) * 1000
+
+
+async def run_shadow(candidate, input_dict, prediction_value, primary_ms):
+    try:
+        # The candidate runs in a worker thread so it never holds up the event loop
+        loop = asyncio.get_running_loop()
+        shadow_value, candidate_ms = await loop.run_in_executor(None, shadow_predict, candidate, input_dict)
+        experiment_router.record_shadow(candidate.version, shadow_value == prediction_value, primary_ms, candidate_ms)
+    except Exception as e:
+        experiment_router.record_shadow_error(candidate.version)
+        sampled_logger.warning("shadow_failed", "Shadow evaluation failed", version=candidate.version, error=str(e))
+    finally:
+        experiment_router.shadow_done()
+
+
+def mirror_to_shadow(served_version, input_dict, prediction_value, timings):
+    """Schedule a shadow evaluation of the request if it was sampled; returns immediately."""
+    candidate = experiment_models.get(experiment_router.shadow_version)
+    if candidate is None or not experiment_router.should_shadow(served_version):
+        return
+    # Cache hits have no inference latency to compare against. A micro-batched
+    # row is compared by its share of the batch's evaluation, without the wait.
+    if "inference" in timings:
+        primary_ms = timings["preprocess"] + timings["inference"]
+    else:
+        primary_ms = timings.get("batch_share")
+    task = asyncio.create_task(run_shadow(candidate, input_dict, prediction_value, primary_ms))
+    shadow_tasks.add(task)
+    task.add_done_callback(shadow_tasks.discard)
+
+
+@app.on_event("shutdown")
+async def stop_experiments():
+    for task in list(shadow_tasks):
+        task.cancel()
+
+# --- 4.5. Micro-batching ---
+# Concurrent single-row /predict-style misses are queued and evaluated together:
+# a batch is dispatched once MICRO_BATCH_MAX_SIZE requests are waiting or
+# MICRO_BATCH_MAX_WAIT_MS after its first request, so one preprocess and one
+# forest evaluation serve many callers. Keep the size at or below
+# COMPILED_MAX_ROWS to stay on the compiled engine.
+MICRO_BATCH_ENABLED = os.getenv("MICRO_BATCH_ENABLED", "true").lower() == "true"
+MICRO_BATCH_MAX_SIZE = int(os.getenv("MICRO_BATCH_MAX_SIZE", "64"))
+MICRO_BATCH_MAX_WAIT_MS = float(os.getenv("MICRO_BATCH_MAX_WAIT_MS", "2"))
+
+
+def record_micro_batch(size, seconds):
+    MICRO_BATCH_SIZE.observe(size)
+    MICRO_BATCH_LATENCY.observe(seconds)
+
+
+@app.on_event("startup")
+async def start_micro_batcher():
+    if MICRO_BATCH_ENABLED:
+        app.micro_batcher = MicroBatcher(
+            predict_rows,
+            max_batch_size=MICRO_BATCH_MAX_SIZE,
+            max_wait=MICRO_BATCH_MAX_WAIT_MS / 1000,
+            on_batch=record_micro_batch,
+        )
+        app.micro_batcher.start()
+
+
+@app.on_event("shutdown")
+async def stop_micro_batcher():
+    if getattr(app, 'micro_batcher', None) is not None:
+        await app.micro_batcher.stop()
+        app.micro_batcher = None
+
+# --- 4.6. Model loading and readiness ---
+def keeps_sklearn_model():
+    # Batches above COMPILED_MAX_ROWS are faster through sklearn. Shared mode
+    # and inference workers keep the API process free of its own copy.
+    return not SHARED_MODEL and INFERENCE_WORKERS == 0
+
+
+async def load_active_model():
+    """Load, warm up and activate the serving model, then what can wait until it is serving."""
+    global active_model
+    loop = asyncio.get_running_loop()
+    started = step = time.perf_counter()
+
+    def mark(name):
+        nonlocal step
+        now = time.perf_counter()
+        startup_profile[name] = round((now - step) * 1000, 1)
+        step = now
+
+    # A reload requested meanwhile waits until the initial version is in place
+    async with model_swap_lock:
+        try:
+            serving = await loop.run_in_executor(None, load_model_version)
+            startup_profile["model_load"] = serving.load_profile
+            mark("model_load_ms")
+            await loop.run_in_executor(None, serving.warm_up)
+            mark("warm_up_ms")
+            if INFERENCE_WORKERS > 0:
+                # Warm every worker up so the first requests don't pay for loading the model
+                app.inference_pool = await start_pool_for(serving)
+                app.inference_pool_version = serving.version
+                mark("inference_pool_ms")
+                log(logger, logging.INFO, "Inference process pool started", workers=INFERENCE_WORKERS)
+        except Exception as e:
+            model_load_state.update(status="failed", error=str(e))
+            log(logger, logging.ERROR, "Could not load the model - have you run model training?", error=str(e))
+            raise
+        active_model = serving
+
+    model_load_state["status"] = "ready"
+    startup_profile["ready_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    log(logger, logging.INFO, "Model ready", version=serving.version, backend=serving.backend, **startup_profile)
+
+    if experiment_router.required_versions:
+        try:
+            await load_experiment_models(experiment_router.required_versions)
+        except Exception as e:
+            log(logger, logging.ERROR, "Could not load evaluation models", error=str(e))
+    if keeps_sklearn_model():
+        await loop.run_in_executor(None, serving.load_model)
+
+
+@app.on_event("startup")
+async def start_model_loading():
+    if MODEL_LOAD_MODE == "blocking":
+        await load_active_model()
+    else:
+        app.model_loader = asyncio.create_task(load_active_model())
+        # The failure is already logged and reported by /ready
+        app.model_loader.add_done_callback(lambda task: task.cancelled() or task.exception())
+
+
+@app.on_event("shutdown")
+async def stop_model_loading():
+    if getattr(app, 'model_loader', None) is not None:
+        app.model_loader.cancel()
+
+# --- 4.7. Retention and rollups ---
+# Raw predictions older than RETENTION_COMPACT_AFTER_HOURS are compacted into
+# hourly and daily per-style rollups (see retention.py), and TTL indexes drop
+# raw documents after RETENTION_RAW_DAYS and hourly rollups after
+# RETENTION_HOURLY_DAYS; 0 keeps them indefinitely. Daily rollups are kept, so
+# /predictions/trends still covers history the raw documents no longer do.
+# Labelled predictions expire like the rest, so retrain.py should consume
+# feedback well within RETENTION_RAW_DAYS.
+RETENTION_ENABLED = os.getenv("RETENTION_ENABLED", "true").lower() == "true"
+RETENTION_RAW_DAYS = int(os.getenv("RETENTION_RAW_DAYS", "30"))
+RETENTION_COMPACT_AFTER_HOURS = int(os.getenv("RETENTION_COMPACT_AFTER_HOURS", "24"))
+RETENTION_HOURLY_DAYS = int(os.getenv("RETENTION_HOURLY_DAYS", "90"))
+RETENTION_INTERVAL = float(os.getenv("RETENTION_INTERVAL", "3600"))
+
+
+async def run_retention():
+    """One compaction pass; skipped (None) while MongoDB is unavailable or another process holds the lease."""
+    if getattr(app, 'retention', None) is None or not mongo_breaker.allow():
+        return None
+    with mongo_breaker.track():
+        result = await app.retention.run_once()
+    if result and (result["migrated"] or result["compacted_hours"]):
+        log(logger, logging.INFO, "Compacted predictions", **result)
+    return result
+
+
+async def compact_predictions():
+    while True:
+        try:
+            await run_retention()
+        except Exception as e:
+            log(logger, logging.ERROR, "Retention run failed", error=str(e))
+        await asyncio.sleep(RETENTION_INTERVAL)
+
+# --- 5. MongoDB Connection Events ---
+mongo_health = {"status": "disconnected", "details": "MongoDB client not initialized", "checked_at": None}
+
+
+async def ensure_indexes():
+    # Optional: add index for prediction_id
+    await app.mongodb["predictions"].create_index("prediction_id", unique=True)
+    # Serve the newest-first listing (optionally per style) from index range scans
+    await app.mongodb["predictions"].create_index([("predicted_at", -1), ("_id", -1)])
+    await app.mongodb["predictions"].create_index([("learning_style", 1), ("predicted_at", -1), ("_id", -1)])
+    # Only labelled predictions carry feedback_at; retraining scans them in order
+    await app.mongodb["predictions"].create_index([("feedback_at", 1)], sparse=True)
+    app.mongodb_indexes_ready = True
+
+
+async def check_mongodb():
+    """Ping MongoDB, feed the result to the circuit breaker and cache it for /health."""
+    started = time.perf_counter()
     try:
-        app.mongodb_client = AsyncIOMotorClient(MONGODB_URL)
-        app.mongodb = app.mongodb_client[DATABASE_NAME]
-        
-        # Test the connection
         await app.mongodb_client.admin.command('ping')
-        
-        # Optional: add index for prediction_id
-        await app.mongodb["predictions"].create_index("prediction_id", unique=True)
-        print("✅ Connected to MongoDB successfully!")
-        
+        if not getattr(app, 'mongodb_indexes_ready', False):
+            await ensure_indexes()
+        mongo_breaker.record_success()
+        mongo_health.update(status="connected", details="MongoDB is accessible",
+                            latency_ms=round((time.perf_counter() - started) * 1000, 3))
     except Exception as e:
-        print(f"❌ Failed to connect to MongoDB: {e}")
-        # Don't raise the exception to allow the app to start without MongoDB
+        mongo_breaker.record_failure(e)
+        mongo_health.update(status="disconnected", details=f"MongoDB error: {str(e)}", latency_ms=None)
+    mongo_health["checked_at"] = datetime.datetime.utcnow().isoformat()
+    return mongo_health["status"] == "connected"
+
+
+async def monitor_mongodb():
+    while True:
+        await asyncio.sleep(MONGO_HEALTH_INTERVAL)
+        was_connected = mongo_health["status"] == "connected"
+        if await check_mongodb() != was_connected:
+            log(logger, logging.INFO if not was_connected else logging.ERROR,
+                "MongoDB connection state changed", status=mongo_health["status"], details=mongo_health["details"])
+
+
+def require_predictions_collection():
+    """The predictions collection, or a 503 while MongoDB is missing or its circuit is open."""
+    if getattr(app, 'mongodb', None) is None:
+        raise HTTPException(status_code=503, detail="MongoDB not available")
+    if not mongo_breaker.allow():
+        raise HTTPException(
+            status_code=503,
+            detail="MongoDB temporarily unavailable",
+            headers={"Retry-After": str(max(1, round(mongo_breaker.retry_after())))},
+        )
+    return app.mongodb["predictions"]
+
+
+@app.on_event("startup")
+async def startup_db_client():
+    app.mongodb_client = AsyncIOMotorClient(
+        MONGODB_URL,
+        maxPoolSize=MONGO_MAX_POOL_SIZE,
+        minPoolSize=MONGO_MIN_POOL_SIZE,
+        serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        connectTimeoutMS=MONGO_CONNECT_TIMEOUT_MS,
+        socketTimeoutMS=MONGO_SOCKET_TIMEOUT_MS,
+        waitQueueTimeoutMS=MONGO_WAIT_QUEUE_TIMEOUT_MS,
+    )
+    app.mongodb = app.mongodb_client[DATABASE_NAME]
+
+    if WRITE_BEHIND_ENABLED:
+        predictions = app.mongodb["predictions"]
+
+        async def insert_batch(documents):
+            # A failed flush is retried by the queue; while the circuit is open
+            # it fails immediately instead of waiting for server selection
+            if not mongo_breaker.allow():
+                raise CircuitOpenError("MongoDB circuit is open")
+            started = time.perf_counter()
+            try:
+                with mongo_breaker.track():
+                    return await predictions.insert_many(documents, ordered=False)
+            finally:
+                MONGO_WRITE_LATENCY.observe(time.perf_counter() - started, operation="insert_many")
+
+        app.prediction_writer = WriteBehindQueue(
+            insert_batch,
+            batch_size=WRITE_BEHIND_BATCH_SIZE,
+            flush_interval=WRITE_BEHIND_FLUSH_INTERVAL,
+            max_pending=WRITE_BEHIND_MAX_PENDING,
+            policy=WRITE_BEHIND_POLICY,
+        )
+        app.prediction_writer.start()
+
+    # The client is kept when MongoDB is down: the driver reconnects on its
+    # own and the monitor creates the indexes once the server is reachable
+    if await check_mongodb():
+        logger.info("Connected to MongoDB")
+    else:
+        mongo_breaker.trip()
+        log(logger, logging.ERROR, "Failed to connect to MongoDB", error=mongo_health["details"])
+    if MONGO_HEALTH_INTERVAL > 0:
+        app.mongodb_monitor = asyncio.create_task(monitor_mongodb())
+    if RETENTION_ENABLED:
+        app.retention = RetentionJob(
+            app.mongodb,
+            raw_days=RETENTION_RAW_DAYS,
+            compact_after_hours=RETENTION_COMPACT_AFTER_HOURS,
+            hourly_days=RETENTION_HOURLY_DAYS,
+        )
+        if RETENTION_INTERVAL > 0:
+            app.retention_task = asyncio.create_task(compact_predictions())
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    if getattr(app, 'mongodb_monitor', None) is not None:
+        app.mongodb_monitor.cancel()
+    if getattr(app, 'retention_task', None) is not None:
+        app.retention_task.cancel()
+    if getattr(app, 'prediction_writer', None) is not None:
+        await app.prediction_writer.drain()
+        log(logger, logging.INFO, "Flushed pending predictions", **app.prediction_writer.stats())
     if hasattr(app, 'mongodb_client'):
         app.mongodb_client.close()
-        print("✅ Disconnected from MongoDB successfully!")
-    print("❌ Disconnected from MongoDB.")
+        logger.info("Disconnected from MongoDB")
 
 # --- 6. Custom Exception Handler ---
 @app.exception_handler(RequestValidationError)
@@ -90,27 +799,122 @@ def root():
 # --- 7.1. Health check endpoint ---
 @app.get("/health")
 async def health_check():
-    mongodb_status = "disconnected"
-    mongodb_details = None
-    
-    try:
-        if hasattr(app, 'mongodb_client') and app.mongodb_client is not None:
-            # Test MongoDB connection
-            await app.mongodb_client.admin.command('ping')
-            mongodb_status = "connected"
-            mongodb_details = "MongoDB is accessible"
-        else:
-            mongodb_details = "MongoDB client not initialized"
-    except Exception as e:
-        mongodb_details = f"MongoDB error: {str(e)}"
-    
+    # Connection state comes from the background monitor instead of a live
+    # ping, so health checks cost nothing and never wait on MongoDB
     return {
         "api_status": "healthy",
-        "mongodb_status": mongodb_status,
-        "mongodb_details": mongodb_details,
+        "mongodb_status": mongo_health["status"],
+        "mongodb_details": mongo_health["details"],
+        "mongodb_checked_at": mongo_health["checked_at"],
+        "mongodb_ping_ms": mongo_health.get("latency_ms"),
+        "mongodb_circuit": mongo_breaker.stats(),
+        "model_status": model_load_state["status"],
+        "model_error": model_load_state["error"],
+        "model_version": active_version(),
+        "inference_backend": active_model.backend if active_model is not None else None,
+        "shared_model": active_model.shared if active_model is not None else None,
+        "inference_workers": INFERENCE_WORKERS,
+        "startup": startup_profile,
+        "prediction_cache": prediction_cache.stats(),
+        "explanation_cache": explanation_cache.stats(),
+        "lookup_table": active_model.lookup.stats() if active_model is not None and active_model.lookup is not None else None,
+        "micro_batching": app.micro_batcher.stats() if getattr(app, 'micro_batcher', None) else None,
+        "write_behind": app.prediction_writer.stats() if getattr(app, 'prediction_writer', None) else None,
+        "retention": app.retention.stats() if getattr(app, 'retention', None) else None,
         "timestamp": datetime.datetime.utcnow().isoformat()
     }
 
+# --- 7.1.1. Readiness probe ---
+# Unlike /health (liveness), this only succeeds once predictions can be served
+@app.get("/ready")
+async def readiness_check():
+    if active_model is None:
+        return JSONResponse(
+            status_code=503,
+            content={"status": model_load_state["status"], "error": model_load_state["error"]},
+            headers={"Retry-After": "5"},
+        )
+    return {"status": "ready", "model_version": active_model.version}
+
+# --- 7.2. Prometheus metrics ---
+def collect_service_metrics():
+    """Scrape-time view of state that is already tracked elsewhere."""
+    samples = [
+        ("model_ready", "gauge", "Whether the model is loaded and predictions are served", [({}, int(active_model is not None))]),
+        ("inference_workers", "gauge", "Inference worker processes", [({}, INFERENCE_WORKERS)]),
+        ("mongodb_up", "gauge", "Whether the last MongoDB ping succeeded", [({}, int(mongo_health["status"] == "connected"))]),
+        ("mongodb_circuit_open", "gauge", "Whether the MongoDB circuit breaker is open",
+         [({}, int(mongo_breaker.state != CircuitBreaker.CLOSED))]),
+        ("mongodb_circuit_opens_total", "counter", "Times the MongoDB circuit opened", [({}, mongo_breaker.opens)]),
+        ("mongodb_circuit_rejected_total", "counter", "MongoDB calls skipped by the open circuit", [({}, mongo_breaker.rejected)]),
+    ]
+    caches = {"predictions": prediction_cache.stats(), "explanations": explanation_cache.stats(),
+              "trends": trends_cache.stats()}
+    for field, type in (("hits", "counter"), ("misses", "counter"), ("evictions", "counter"),
+                        ("expirations", "counter"), ("size", "gauge")):
+        name = f"cache_{field}_total" if type == "counter" else f"cache_{field}"
+        samples.append((name, type, f"Cache {field}", [({"cache": cache}, stats[field]) for cache, stats in caches.items()]))
+
+    if active_model is not None:
+        samples.append(("model_info", "gauge", "Model version being served",
+                        [({"version": active_model.version, "backend": active_model.backend}, 1)]))
+    if active_model is not None and active_model.lookup is not None:
+        stats = active_model.lookup.stats()
+        samples += [
+            ("lookup_table_entries", "gauge", "Precomputed feature vectors", [({}, stats["entries"])]),
+            ("lookup_table_memory_bytes", "gauge", "Memory held by the lookup table", [({}, stats["memory_bytes"])]),
+            ("lookup_table_hits_total", "counter", "Predictions answered by the lookup table", [({}, stats["hits"])]),
+            ("lookup_table_misses_total", "counter", "Lookups that fell back to the model", [({}, stats["misses"])]),
+        ]
+
+    batcher = getattr(app, 'micro_batcher', None)
+    if batcher is not None:
+        samples.append(("micro_batch_queue_depth", "gauge", "Requests waiting for a micro-batch",
+                        [({}, batcher.stats()["queue_depth"])]))
+
+    writer = getattr(app, 'prediction_writer', None)
+    if writer is not None:
+        stats = writer.stats()
+        samples += [
+            ("write_behind_queue_depth", "gauge", "Predictions waiting to be written", [({}, stats["queue_depth"])]),
+            ("write_behind_written_total", "counter", "Predictions written by the write-behind queue", [({}, stats["written"])]),
+            ("write_behind_dropped_total", "counter", "Predictions dropped by the write-behind queue", [({}, stats["dropped"])]),
+            ("write_behind_flushes_total", "counter", "Write-behind flushes", [({}, stats["flushes"])]),
+            ("write_behind_failed_flushes_total", "counter", "Failed write-behind flushes", [({}, stats["failed_flushes"])]),
+        ]
+
+    job = getattr(app, 'retention', None)
+    if job is not None:
+        samples += [
+            ("retention_runs_total", "counter", "Completed retention runs", [({}, job.runs)]),
+            ("retention_failed_runs_total", "counter", "Failed retention runs", [({}, job.failed_runs)]),
+            ("retention_compacted_hours_total", "counter", "Hours of predictions compacted into rollups",
+             [({}, job.compacted_hours)]),
+            ("retention_rollups_written_total", "counter", "Rollup documents written", [({}, job.rollups_written)]),
+        ]
+        if job.compacted_until is not None:
+            compacted_until = job.compacted_until.replace(tzinfo=datetime.timezone.utc).timestamp()
+            samples.append(("retention_compacted_until_timestamp_seconds", "gauge",
+                            "Unix time up to which predictions are rolled up", [({}, compacted_until)]))
+
+    shadow = experiment_router.stats()["shadow"]
+    if shadow:
+        samples += [
+            ("shadow_mirrored_total", "counter", "Requests mirrored to a shadow model",
+             [({"version": version}, stats["mirrored"]) for version, stats in shadow.items()]),
+            ("shadow_agreement_ratio", "gauge", "Share of mirrored requests where the shadow model agreed",
+             [({"version": version}, stats["agreement_rate"]) for version, stats in shadow.items()]),
+        ]
+    return samples
+
+
+metrics.add_collector(collect_service_metrics)
+
+
+@app.get("/metrics")
+async def get_metrics():
+    return Response(metrics.render(), media_type=CONTENT_TYPE)
+
 # --- 8. Pydantic Model ---
 class StudentData(BaseModel):
     StudyHours: int = Field(..., ge=0, le=100)
@@ -129,91 +933,379 @@ class StudentData(BaseModel):
     StressLevel: int = Field(..., ge=0, le=10)
     FinalGrade: int = Field(..., ge=0, le=10)
 
-# --- 9. Prediction Endpoint ---
-@app.post("/predict-style")
-async def predict_learning_style(data: StudentData):
+# --- 8.1. Request body decoding ---
+# The prediction endpoints read their body themselves so they can accept the
+# packed binary layout from wire_format.py next to JSON. JSON bodies are
+# validated straight from bytes by pydantic-core; errors keep FastAPI's shape.
+STUDENT_RECORDS = TypeAdapter(List[StudentData])
+
+
+def student_request_body(schema):
+    return {"requestBody": {"required": True, "content": {
+        "application/json": {"schema": schema},
+        FEATURES_MEDIA_TYPE: {"schema": {"type": "string", "format": "binary"}},
+    }}}
+
+
+# Bodies above this size (roughly BATCH_OFFLOAD_ROWS JSON records) are decoded
+# in a worker thread, DECODE_CHUNK_ROWS records per validation call: pydantic
+# holds the GIL for a whole call, which would stall the loop even from a thread.
+DECODE_OFFLOAD_BYTES = 64 * 1024
+DECODE_CHUNK_ROWS = 256
+
+
+def body_validation_error(e, offset=0):
+    # Malformed JSON reports the raw bytes as its input; offset shifts record indexes
+    errors = []
+    for error in e.errors():
+        loc = error["loc"]
+        if offset and loc and isinstance(loc[0], int):
+            loc = (loc[0] + offset, *loc[1:])
+        errors.append({**error, "loc": ("body", *loc),
+                       "input": error["input"].decode("utf-8", "replace") if isinstance(error.get("input"), bytes) else error.get("input")})
+    return RequestValidationError(errors)
+
+
+def validate_records_in_chunks(body):
     try:
-        input_dict = data.dict()
-        input_df = pd.DataFrame([input_dict])
+        records = from_json(body)
+    except ValueError:
+        records = None
+    if not isinstance(records, list):
+        # Not a JSON array: validate_json raises the usual error
+        return STUDENT_RECORDS.validate_json(body)
+    validated, errors = [], []
+    for start in range(0, len(records), DECODE_CHUNK_ROWS):
+        try:
+            validated += STUDENT_RECORDS.validate_python(records[start:start + DECODE_CHUNK_ROWS])
+        except ValidationError as e:
+            errors += body_validation_error(e, offset=start).errors()
+    if errors:
+        raise RequestValidationError(errors)
+    return validated
 
-        expected_columns = [
-            'StudyHours', 'Attendance', 'Resources', 'Extracurricular', 'Motivation', 
-            'Internet', 'Gender', 'Age', 'OnlineCourses', 'Discussions', 
-            'AssignmentCompletion', 'ExamScore', 'EduTech', 'StressLevel', 'FinalGrade'
-        ]
-        input_df = input_df[expected_columns]
-
-        processed_input = preprocessor.transform(input_df)
-        
-        # Get prediction probabilities (confidence percentages for each learning style)
-        prediction_proba = model.predict_proba(processed_input)
-        probabilities = prediction_proba[0]  # Get probabilities for the first (and only) sample
-        
-        # Get the predicted class (highest probability)
-        prediction = model.predict(processed_input)
-        prediction_value = int(prediction[0])
+
+def decode_student_records(body, packed, batch):
+    if packed:
+        return decode_features(body, max_records=None if batch else 1)
+    try:
+        if batch and len(body) > DECODE_OFFLOAD_BYTES:
+            return [record.model_dump() for record in validate_records_in_chunks(body)]
+        if batch:
+            return [record.model_dump() for record in STUDENT_RECORDS.validate_json(body)]
+        return [StudentData.model_validate_json(body).model_dump()]
+    except ValidationError as e:
+        raise body_validation_error(e)
+
+
+async def read_student_records(request: Request, batch: bool):
+    """Decode the request body into StudentData dicts."""
+    body = await request.body()
+    packed = is_packed_request(request)
+    if batch and len(body) > DECODE_OFFLOAD_BYTES:
+        return await asyncio.get_running_loop().run_in_executor(None, decode_student_records, body, packed, batch)
+    return decode_student_records(body, packed, batch)
+
+
+async def prediction_response(request: Request, model_version, predictions, content, in_thread=False):
+    """
+    Packed float32 probabilities when the client asks for them, compact JSON
+    otherwise; ``content`` builds the JSON body, in a worker thread with ``in_thread``.
+    """
+    request.state.handler_finished = time.perf_counter()
+    if wants_packed_response(request):
+        return Response(
+            encode_probabilities([probabilities for probabilities, _ in predictions]),
+            media_type=PROBABILITIES_MEDIA_TYPE,
+            headers={"X-Model-Version": model_version},
+        )
+    if in_thread:
+        return FastJSONResponse(await asyncio.get_running_loop().run_in_executor(None, content))
+    return FastJSONResponse(content())
+
+# --- 9. Prediction Endpoint ---
+@app.post("/predict-style", response_class=FastJSONResponse,
+          openapi_extra=student_request_body(StudentData.model_json_schema()))
+async def predict_learning_style(request: Request):
+    require_model()
+    input_dict = (await read_student_records(request, batch=False))[0]
+    stage_start = record_stage(request, "validation", request.state.request_started)
+    try:
+        model_version, predictions = await predict_cached([input_dict], request.state.timings, route_request())
+        probabilities, prediction_value = predictions[0]
+        experiment_router.record_request(model_version, 1, (time.perf_counter() - stage_start) * 1000)
+        PREDICTIONS.inc(model_version=model_version)
+        mirror_to_shadow(model_version, input_dict, prediction_value, request.state.timings)
+        stage_start = time.perf_counter()
 
         # Generate a custom UUID for easier lookups
         prediction_uuid = str(uuid.uuid4())
 
-        # Use a single timestamp for DB and response
-        predicted_at = datetime.datetime.utcnow().isoformat()
+        # Naive UTC as a native date, so it is range-indexed and the TTL index can expire it
+        predicted_at = datetime.datetime.utcnow()
+
+        document = {
+            "prediction_id": prediction_uuid,
+            "learning_style": prediction_value,
+            "predicted_at": predicted_at,
+            "user_data": input_dict,
+            "probabilities": probabilities.tolist(),  # Save probabilities as well
+            "model_version": model_version
+        }
 
         # Try to save to MongoDB, but don't fail if MongoDB is unavailable
         try:
-            if hasattr(app, 'mongodb') and app.mongodb is not None:
-                result = await app.mongodb["predictions"].insert_one({
-                    "prediction_id": prediction_uuid,
+            if getattr(app, 'prediction_writer', None) is not None:
+                if not await app.prediction_writer.enqueue(document):
+                    PREDICTIONS_NOT_SAVED.inc(reason="queue_full")
+                    sampled_logger.warning("write_behind_full", "Write-behind queue full - prediction not saved to database")
+            elif getattr(app, 'mongodb', None) is None:
+                PREDICTIONS_NOT_SAVED.inc(reason="mongodb_unavailable")
+                sampled_logger.warning("mongodb_unavailable", "MongoDB not available - prediction not saved to database")
+            elif not mongo_breaker.allow():
+                PREDICTIONS_NOT_SAVED.inc(reason="circuit_open")
+                sampled_logger.warning("mongodb_circuit_open", "MongoDB circuit open - prediction not saved to database")
+            else:
+                with mongo_breaker.track():
+                    result = await app.mongodb["predictions"].insert_one(document)
+                MONGO_WRITE_LATENCY.observe(time.perf_counter() - stage_start, operation="insert_one")
+                log(logger, logging.DEBUG, "Prediction saved to MongoDB", id=str(result.inserted_id))
+        except Exception as mongo_error:
+            PREDICTIONS_NOT_SAVED.inc(reason="mongodb_error")
+            sampled_logger.warning("mongodb_error", "MongoDB error (prediction still successful)", error=str(mongo_error))
+        record_stage(request, "persistence", stage_start)
+
+        # Return only prediction information - NO database details
+        return await prediction_response(
+            request, model_version, predictions,
+            lambda: {**format_prediction(probabilities, prediction_value), "status": "success"},
+        )
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=f"Validation error: {str(e)}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Prediction error: {str(e)}")
+
+# --- 9.1. Batch Prediction Endpoint ---
+# At most MAX_BATCH_SIZE records per request (413 above it); large batches are
+# decoded and evaluated off the event loop (see BATCH_OFFLOAD_ROWS).
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", "10000"))
+
+
+@app.post("/predict-style/batch", response_class=FastJSONResponse,
+          openapi_extra=student_request_body(STUDENT_RECORDS.json_schema()))
+async def predict_learning_style_batch(request: Request):
+    require_model()
+    input_dicts = await read_student_records(request, batch=True)
+    if not input_dicts:
+        raise HTTPException(status_code=422, detail="At least one record is required")
+    if len(input_dicts) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BATCH_SIZE} records can be predicted per request")
+
+    stage_start = record_stage(request, "validation", request.state.request_started)
+    try:
+        # Preprocess and evaluate the forest once over all cache misses
+        model_version, predictions = await predict_cached(input_dicts, request.state.timings, route_request())
+        experiment_router.record_request(model_version, len(input_dicts), (time.perf_counter() - stage_start) * 1000)
+        PREDICTIONS.inc(len(input_dicts), model_version=model_version)
+        stage_start = time.perf_counter()
+
+        predicted_at = datetime.datetime.utcnow()
+
+        def build_documents():
+            return [
+                {
+                    "prediction_id": str(uuid.uuid4()),
                     "learning_style": prediction_value,
                     "predicted_at": predicted_at,
                     "user_data": input_dict,
-                    "probabilities": probabilities.tolist()  # Save probabilities as well
-                })
-                print(f"✅ Prediction saved to MongoDB with ID: {str(result.inserted_id)}")
+                    "probabilities": probabilities.tolist(),
+                    "model_version": model_version
+                }
+                for input_dict, (probabilities, prediction_value) in zip(input_dicts, predictions)
+            ]
+
+        offload = len(input_dicts) > BATCH_OFFLOAD_ROWS
+        if offload:
+            documents = await asyncio.get_running_loop().run_in_executor(None, build_documents)
+        else:
+            documents = build_documents()
+
+        # Persist the whole batch in a single round trip
+        try:
+            if getattr(app, 'prediction_writer', None) is not None:
+                accepted = await app.prediction_writer.enqueue_many(documents)
+                if accepted < len(documents):
+                    PREDICTIONS_NOT_SAVED.inc(len(documents) - accepted, reason="queue_full")
+                    sampled_logger.warning("write_behind_full", "Write-behind queue full - batch predictions not saved to database",
+                                           not_saved=len(documents) - accepted)
+            elif getattr(app, 'mongodb', None) is None:
+                PREDICTIONS_NOT_SAVED.inc(len(documents), reason="mongodb_unavailable")
+                sampled_logger.warning("mongodb_unavailable", "MongoDB not available - batch predictions not saved to database")
+            elif not mongo_breaker.allow():
+                PREDICTIONS_NOT_SAVED.inc(len(documents), reason="circuit_open")
+                sampled_logger.warning("mongodb_circuit_open", "MongoDB circuit open - batch predictions not saved to database")
             else:
-                print("⚠ MongoDB not available - prediction not saved to database")
+                with mongo_breaker.track():
+                    result = await app.mongodb["predictions"].insert_many(documents, ordered=False)
+                MONGO_WRITE_LATENCY.observe(time.perf_counter() - stage_start, operation="insert_many")
+                log(logger, logging.DEBUG, "Batch predictions saved to MongoDB", count=len(result.inserted_ids))
         except Exception as mongo_error:
-            print(f"⚠ MongoDB error (prediction still successful): {mongo_error}")
-
-        # Map numeric prediction to a readable name for frontend display
-        style_names = ['Visual', 'Auditory', 'Kinesthetic', 'Reading/Writing']
-        
-        # Build the prediction results with percentages for each learning style
-        prediction_results = []
-        for idx, style_name in enumerate(style_names):
-            prediction_results.append({
-                "style": style_name,
-                "percentage": round(float(probabilities[idx]) * 100, 2),
-                "is_predicted": idx == prediction_value
-            })
+            PREDICTIONS_NOT_SAVED.inc(len(documents), reason="mongodb_error")
+            sampled_logger.warning("mongodb_error", "MongoDB error (batch predictions still successful)", error=str(mongo_error))
+        record_stage(request, "persistence", stage_start)
 
-        # Return only prediction information - NO database details
-        return {
-            "predicted_style": style_names[prediction_value],
-            "predictions": prediction_results,
+        return await prediction_response(request, model_version, predictions, lambda: {
+            "results": [format_prediction(probabilities, value) for probabilities, value in predictions],
+            "count": len(predictions),
             "status": "success"
-        }
-    except ValidationError as e:
-        raise HTTPException(status_code=422, detail=f"Validation error: {str(e)}")
+        }, in_thread=offload)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Prediction error: {str(e)}")
 
+# --- 9.2. Prediction Explanations ---
+# Why a profile got its learning style: each field's contribution, in
+# percentage points, to every style's probability, from the tree-interpreter
+# decomposition of the active model's forest. The base percentages plus all
+# contributions of a style add up to its percentage (up to rounding).
+# Explanations are cached per model version and feature tuple, computed in a
+# worker thread so a large batch never holds up the event loop, and batches are
+# capped at EXPLAIN_MAX_BATCH_SIZE rows.
+EXPLAIN_MAX_BATCH_SIZE = int(os.getenv("EXPLAIN_MAX_BATCH_SIZE", "1000"))
+EXPLANATION_CACHE_SIZE = int(os.getenv("EXPLANATION_CACHE_SIZE", "10000"))  # 0 disables the cache
+explanation_cache = PredictionCache(maxsize=EXPLANATION_CACHE_SIZE, ttl=PREDICTION_CACHE_TTL)
+EXPLANATIONS = metrics.counter("explanations_total", "Rows explained by model version", ("model_version",))
+
+
+def format_explanation(input_dict, probabilities, prediction_value, bias, contributions):
+    """Response entry for one row; ``contributions`` is (fields, styles), strongest for the predicted style first."""
+    predicted_style = STYLE_NAMES[prediction_value]
+    fields = [
+        {
+            "feature": column,
+            "value": input_dict[column],
+            "contributions": {style: round(value * 100, 2) for style, value in zip(STYLE_NAMES, row)},
+        }
+        for column, row in zip(FEATURE_COLUMNS, contributions.tolist())
+    ]
+    fields.sort(key=lambda field: abs(field["contributions"][predicted_style]), reverse=True)
+    return {
+        **format_prediction(probabilities, prediction_value),
+        "base_percentages": {style: round(float(value) * 100, 2) for style, value in zip(STYLE_NAMES, bias)},
+        "contributions": fields,
+    }
+
+
+def explain_rows(serving, input_dicts, predictions):
+    bias, contributions = serving.explain(input_dicts)
+    return [
+        format_explanation(input_dict, probabilities, prediction_value, bias, row)
+        for input_dict, (probabilities, prediction_value), row in zip(input_dicts, predictions, contributions)
+    ]
+
+
+async def explain_records(input_dicts, timings):
+    """Return the active model version and an explanation for every input, computing only the cache misses."""
+    serving = active_model
+    keys = [(serving.version, feature_key(input_dict)) for input_dict in input_dicts]
+    results = [explanation_cache.get(key) for key in keys]
+    missing = [i for i, result in enumerate(results) if result is None]
+    if missing:
+        missing_dicts = [input_dicts[i] for i in missing]
+        # Percentages and predicted style match what /predict-style returns
+        _, predictions = await predict_cached(missing_dicts, timings, serving)
+        started = time.perf_counter()
+        explained = await asyncio.get_running_loop().run_in_executor(
+            None, explain_rows, serving, missing_dicts, predictions)
+        timings["explanation"] = (time.perf_counter() - started) * 1000
+        for i, explanation in zip(missing, explained):
+            results[i] = explanation
+            explanation_cache.put(keys[i], explanation)
+    EXPLANATIONS.inc(len(input_dicts), model_version=serving.version)
+    return serving.version, results
+
+
+@app.post("/predict-style/explain", response_class=FastJSONResponse,
+          openapi_extra=student_request_body(StudentData.model_json_schema()))
+async def explain_learning_style(request: Request):
+    require_model()
+    input_dicts = await read_student_records(request, batch=False)
+    record_stage(request, "validation", request.state.request_started)
+    try:
+        model_version, explanations = await explain_records(input_dicts, request.state.timings)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Explanation error: {str(e)}")
+    request.state.handler_finished = time.perf_counter()
+    return FastJSONResponse({**explanations[0], "model_version": model_version, "status": "success"})
+
+
+@app.post("/predict-style/explain/batch", response_class=FastJSONResponse,
+          openapi_extra=student_request_body(STUDENT_RECORDS.json_schema()))
+async def explain_learning_style_batch(request: Request):
+    require_model()
+    input_dicts = await read_student_records(request, batch=True)
+    if not input_dicts:
+        raise HTTPException(status_code=422, detail="At least one record is required")
+    if len(input_dicts) > EXPLAIN_MAX_BATCH_SIZE:
+        raise HTTPException(status_code=422, detail=f"At most {EXPLAIN_MAX_BATCH_SIZE} records can be explained per request")
+    record_stage(request, "validation", request.state.request_started)
+    try:
+        model_version, explanations = await explain_records(input_dicts, request.state.timings)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Explanation error: {str(e)}")
+    request.state.handler_finished = time.perf_counter()
+    return FastJSONResponse({
+        "results": explanations,
+        "count": len(explanations),
+        "model_version": model_version,
+        "status": "success"
+    })
+
 # --- 10. Get Recent Predictions ---
+# Newest first, paginated with opaque keyset cursors: pass "next_cursor" as
+# `before` for older predictions or "prev_cursor" as `after` for newer ones.
 @app.get("/predictions")
-async def get_predictions(limit: int = 10):
+async def get_predictions(
+    limit: int = Query(10, ge=1, le=100),
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    fields: Optional[str] = Query(None, description="Comma-separated fields to return"),
+    learning_style: Optional[str] = Query(None, description="Style name or index"),
+):
     try:
-        if not hasattr(app, 'mongodb') or app.mongodb is None:
-            raise HTTPException(status_code=503, detail="MongoDB not available")
-            
-        cursor = app.mongodb["predictions"].find().sort("predicted_at", -1).limit(limit)
-        predictions = await cursor.to_list(length=limit)
+        if before and after:
+            raise HTTPException(status_code=422, detail="Use either 'before' or 'after', not both")
 
+        try:
+            query = {}
+            if learning_style is not None:
+                query["learning_style"] = parse_learning_style(learning_style)
+            if before:
+                query.update(keyset_filter(before, "before"))
+            elif after:
+                query.update(keyset_filter(after, "after"))
+            projection = parse_projection(fields)
+        except ValueError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+
+        # Pages after a cursor are read oldest-first from the cursor, then flipped
+        direction = 1 if after else -1
+        cursor = require_predictions_collection().find(query, projection) \
+            .sort([("predicted_at", direction), ("_id", direction)]).limit(limit)
+        with mongo_breaker.track():
+            predictions = await cursor.to_list(length=limit)
+        if after:
+            predictions.reverse()
+
+        next_cursor = encode_cursor(predictions[-1]) if predictions else None
+        prev_cursor = encode_cursor(predictions[0]) if predictions else None
         for prediction in predictions:
             prediction["_id"] = str(prediction["_id"])
 
         return {
             "predictions": predictions,
             "count": len(predictions),
+            "next_cursor": next_cursor,
+            "prev_cursor": prev_cursor,
             "status": "success"
         }
     except HTTPException:
@@ -221,6 +1313,272 @@ async def get_predictions(limit: int = 10):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
 
+# --- 10.1. Streaming Export ---
+# Raw predictions only, so the export reaches back RETENTION_RAW_DAYS at most
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+EXPORT_CSV_COLUMNS = ["_id", "prediction_id", "learning_style", "predicted_at"] + FEATURE_COLUMNS + \
+    [f"prob_{name}" for name in STYLE_NAMES]
+
+
+def export_csv_row(document):
+    user_data = document.get("user_data") or {}
+    probabilities = document.get("probabilities") or []
+    return [str(document["_id"]), document.get("prediction_id"), document.get("learning_style"),
+            format_timestamp(document.get("predicted_at"))] + \
+        [user_data.get(col) for col in FEATURE_COLUMNS] + \
+        [probabilities[i] if i < len(probabilities) else None for i in range(len(STYLE_NAMES))]
+
+
+def format_timestamp(value):
+    return value.isoformat() if isinstance(value, datetime.datetime) else value
+
+
+def to_utc_naive(value):
+    """Stored timestamps are naive UTC, so normalise aware query bounds to match."""
+    if value.tzinfo is not None:
+        value = value.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def predicted_at_range(start, end):
+    """
+    Filter on start <= predicted_at < end. Range operators only match values of
+    the bound's BSON type, so predictions stored with ISO-string timestamps
+    (before retention migrates them) are matched with string bounds.
+    """
+    if not (start or end):
+        return {}
+    bounds = {}
+    if start:
+        bounds["$gte"] = to_utc_naive(start)
+    if end:
+        bounds["$lt"] = to_utc_naive(end)
+    return {"$or": [
+        {"predicted_at": bounds},
+        {"predicted_at": {op: value.isoformat() for op, value in bounds.items()}},
+    ]}
+
+
+async def stream_export(cursor, format):
+    """Yield the cursor as NDJSON or CSV, one chunk per fetched batch, so memory stays constant."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if format == "csv":
+        writer.writerow(EXPORT_CSV_COLUMNS)
+
+    rows = 0
+    documents = cursor.__aiter__()
+    while True:
+        try:
+            with mongo_breaker.track():
+                document = await documents.__anext__()
+        except StopAsyncIteration:
+            break
+        if format == "csv":
+            writer.writerow(export_csv_row(document))
+        else:
+            document["_id"] = str(document["_id"])
+            buffer.write(json.dumps(document, default=lambda value: str(format_timestamp(value))))
+            buffer.write("\n")
+        rows += 1
+        if rows % EXPORT_BATCH_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+@app.get("/predictions/export")
+async def export_predictions(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    start: Optional[datetime.datetime] = Query(None, description="Inclusive lower bound on predicted_at"),
+    end: Optional[datetime.datetime] = Query(None, description="Exclusive upper bound on predicted_at"),
+    learning_style: Optional[str] = Query(None, description="Style name or index"),
+):
+    predictions = require_predictions_collection()
+
+    query = {}
+    if learning_style is not None:
+        try:
+            query["learning_style"] = parse_learning_style(learning_style)
+        except ValueError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+    query.update(predicted_at_range(start, end))
+
+    cursor = predictions.find(query) \
+        .sort([("predicted_at", 1), ("_id", 1)]).batch_size(EXPORT_BATCH_SIZE)
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    filename = f"predictions.{'csv' if format == 'csv' else 'ndjson'}"
+    return StreamingResponse(
+        stream_export(cursor, format),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+# --- 10.2. Learning-Style Trends ---
+# Dashboards refresh the same windows repeatedly, so aggregation results are
+# kept in a small TTL cache and each refresh costs O(buckets), not O(predictions).
+# Time before the retention watermark is read from the rollups (hourly ones for
+# hour buckets, daily ones otherwise), which count a bucket when it starts
+# inside [start, end); later time is aggregated from the raw predictions.
+TRENDS_CACHE_TTL = float(os.getenv("TRENDS_CACHE_TTL", "60"))
+trends_cache = PredictionCache(maxsize=128, ttl=TRENDS_CACHE_TTL)
+
+
+async def aggregate_style_buckets(bucket, start, end):
+    """{(bucket_start, learning_style): [count, probability_sums]} across the rollups and raw predictions."""
+    start = to_utc_naive(start) if start else None
+    end = to_utc_naive(end) if end else None
+    watermark = await read_watermark(app.mongodb)
+
+    pipelines = []
+    if watermark is not None and (start is None or start < watermark):
+        bucket_start = {"$lt": min(end, watermark) if end else watermark}
+        if start:
+            bucket_start["$gte"] = start
+        granularity = "hour" if bucket == "hour" else "day"
+        pipelines.append((app.mongodb[ROLLUPS_COLLECTION],
+                          rollup_buckets({"granularity": granularity, "bucket_start": bucket_start}, bucket)))
+    if watermark is None or end is None or end > watermark:
+        raw_start = max(start, watermark) if start and watermark else start or watermark
+        pipelines.append((app.mongodb["predictions"], raw_buckets(predicted_at_range(raw_start, end), bucket)))
+
+    buckets = {}
+    for collection, pipeline in pipelines:
+        for row in await collection.aggregate(pipeline).to_list(length=None):
+            bucket_start, learning_style, count, probability_sums = bucket_row(row)
+            totals = buckets.setdefault((bucket_start, learning_style), [0, [0.0] * len(STYLE_NAMES)])
+            totals[0] += count
+            totals[1] = [a + b for a, b in zip(totals[1], probability_sums)]
+    return buckets
+
+
+@app.get("/predictions/trends")
+async def get_style_trends(
+    bucket: str = Query("day", pattern="^(hour|day|week)$"),
+    start: Optional[datetime.datetime] = None,
+    end: Optional[datetime.datetime] = None,
+):
+    cache_key = (bucket, start, end)
+    trends = trends_cache.get(cache_key)
+    if trends is None:
+        require_predictions_collection()
+        try:
+            with mongo_breaker.track():
+                buckets = await aggregate_style_buckets(bucket, start, end)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+
+        styles_by_bucket = {}
+        for (bucket_start, learning_style), (count, probability_sums) in sorted(buckets.items()):
+            styles_by_bucket.setdefault(bucket_start, []).append({
+                "style": STYLE_NAMES[learning_style],
+                "count": count,
+                "mean_percentages": {
+                    name: round(total / count * 100, 2) if count else None
+                    for name, total in zip(STYLE_NAMES, probability_sums)
+                },
+            })
+        trends = [
+            {"bucket_start": bucket_start.isoformat(), "total": sum(s["count"] for s in styles), "styles": styles}
+            for bucket_start, styles in styles_by_bucket.items()
+        ]
+        trends_cache.put(cache_key, trends)
+
+    return {"bucket": bucket, "trends": trends, "count": len(trends), "status": "success"}
+
+# --- 10.3. Model Registry Admin ---
+# The /admin endpoints change what is served, so they require ADMIN_TOKEN as a
+# bearer token; they are disabled when no ADMIN_TOKEN is configured.
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN") or None
+
+
+def require_admin(authorization: Optional[str] = Header(None)):
+    if ADMIN_TOKEN is None:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled (ADMIN_TOKEN is not set)")
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="Invalid or missing admin token",
+                            headers={"WWW-Authenticate": "Bearer"})
+
+
+@app.get("/admin/models", dependencies=[Depends(require_admin)])
+async def list_model_versions():
+    return {
+        "active_version": active_version(),
+        "registry_current": model_registry.current_version(MODEL_REGISTRY_DIR),
+        "versions": model_registry.list_versions(MODEL_REGISTRY_DIR),
+        "status": "success"
+    }
+
+
+@app.post("/admin/models/reload", dependencies=[Depends(require_admin)])
+async def reload_model(version: Optional[str] = None):
+    """Load ``version`` (the registry's CURRENT one by default) in the background and swap it in."""
+    if version is not None and version not in {v["version"] for v in model_registry.list_versions(MODEL_REGISTRY_DIR)}:
+        raise HTTPException(status_code=404, detail=f"Unknown model version: {version}")
+    try:
+        serving = await activate_model_version(version, set_current=version is not None)
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=f"Model files not found: {e}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Model reload failed: {str(e)}")
+    return {"active_version": serving.version, "backend": serving.backend, "status": "success"}
+
+# --- 10.4. Shadow and A/B Evaluation Admin ---
+class ExperimentConfig(BaseModel):
+    ab_weights: Dict[str, float] = Field(default_factory=dict)
+    shadow_version: Optional[str] = None
+    shadow_fraction: float = Field(0.0, ge=0, le=1)
+
+
+@app.get("/admin/experiments", dependencies=[Depends(require_admin)])
+async def get_experiments():
+    return {
+        "active_version": active_version(),
+        "loaded_versions": sorted(experiment_models),
+        **experiment_router.stats(),
+        "status": "success"
+    }
+
+
+@app.post("/admin/experiments", dependencies=[Depends(require_admin)])
+async def configure_experiments(config: ExperimentConfig):
+    """Change the A/B weights and shadow candidate; the versions are loaded before traffic is routed to them."""
+    known = {v["version"] for v in model_registry.list_versions(MODEL_REGISTRY_DIR)} | {active_version()}
+    unknown = (set(config.ab_weights) | ({config.shadow_version} - {None})) - known
+    if unknown:
+        raise HTTPException(status_code=404, detail=f"Unknown model versions: {sorted(unknown)}")
+    try:
+        requested = ExperimentRouter(config.ab_weights, config.shadow_version, config.shadow_fraction)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    try:
+        # Load first so no request is routed to a version that isn't ready
+        await load_experiment_models(requested.required_versions)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Could not load evaluation models: {str(e)}")
+    experiment_router.configure(config.ab_weights, config.shadow_version, config.shadow_fraction)
+    for version in set(experiment_models) - experiment_router.required_versions:
+        del experiment_models[version]
+    return await get_experiments()
+
+# --- 10.5. Retention Admin ---
+@app.post("/admin/retention/run", dependencies=[Depends(require_admin)])
+async def run_retention_now():
+    """Compact now instead of waiting for the next RETENTION_INTERVAL."""
+    if getattr(app, 'retention', None) is None:
+        raise HTTPException(status_code=404, detail="Retention is disabled")
+    require_predictions_collection()
+    try:
+        result = await run_retention()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Retention run failed: {str(e)}")
+    if result is None:
+        raise HTTPException(status_code=409, detail="A retention run is already in progress")
+    return {**result, "status": "success"}
+
 # --- 11. Get Prediction by ID (UUID or Mongo ObjectId) ---
 @app.get("/predictions/{prediction_id}")
 async def get_prediction_by_id(prediction_id: str):
@@ -230,12 +1588,43 @@ async def get_prediction_by_id(prediction_id: str):
         else:
             query = {"prediction_id": prediction_id}
 
-        prediction = await app.mongodb["predictions"].find_one(query)
+        predictions = require_predictions_collection()
+        with mongo_breaker.track():
+            prediction = await predictions.find_one(query)
 
         if prediction is None:
             raise HTTPException(status_code=404, detail="Prediction not found")
 
         prediction["_id"] = str(prediction["_id"])
         return {"prediction": prediction, "status": "success"}
+    except HTTPException:
+        raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+# --- 11.1. Prediction Feedback ---
+# The observed learning style for a prediction; labelled predictions are what
+# retrain.py learns from incrementally.
+class PredictionFeedback(BaseModel):
+    learning_style: str = Field(..., description="Style name or index")
+
+
+@app.post("/predictions/{prediction_id}/feedback")
+async def submit_prediction_feedback(prediction_id: str, feedback: PredictionFeedback):
+    try:
+        feedback_style = parse_learning_style(feedback.learning_style)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    query = {"_id": ObjectId(prediction_id)} if ObjectId.is_valid(prediction_id) else {"prediction_id": prediction_id}
+
+    predictions = require_predictions_collection()
+    try:
+        with mongo_breaker.track():
+            result = await predictions.update_one(query, {"$set": {
+                "feedback_style": feedback_style,
+                "feedback_at": datetime.datetime.utcnow().isoformat(),
+            }})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+    if result.matched_count == 0:
+        raise HTTPException(status_code=404, detail="Prediction not found")
+    return {"prediction_id": prediction_id, "feedback_style": STYLE_NAMES[feedback_style], "status": "success"}
@@ -0,0 +1,134 @@
+import asyncio
+import time
+
+
+class MicroBatcher:
+    """
+    Coalesces concurrent single-row predictions into batched inference calls.
+
+    Callers ``await submit(serving, input_dict)``; a background task takes the
+    first waiting request and, if others are already queued behind it, collects
+    more until ``max_batch_size`` requests are queued or ``max_wait`` seconds
+    have passed. The batch is evaluated with one ``predict_many(serving,
+    input_dicts)`` call per model version in it. Each caller's future is
+    resolved with its own (probabilities, prediction_value), or with the
+    exception the batch raised.
+    """
+
+    def __init__(self, predict_many, max_batch_size=64, max_wait=0.002, on_batch=None):
+        self._predict_many = predict_many
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._on_batch = on_batch
+        self._queue = asyncio.Queue()
+        self._task = None
+
+        self.requests = 0
+        self.batches = 0
+        self.max_seen_batch_size = 0
+        self.errors = 0
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def submit(self, serving, input_dict, timings=None):
+        """
+        Queue one row and wait for its result. When ``timings`` is given, the
+        row's share of its group's evaluation (the evaluation time divided by
+        the rows evaluated with it) is stored under ``batch_share`` in ms.
+        """
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((serving, input_dict, timings, future))
+        return await future
+
+    async def _next_batch(self):
+        """
+        Wait for the first request, then collect more until the batch is full or
+        the wait ends. A request that is alone once the tasks already scheduled
+        have run is dispatched at once, so low traffic doesn't pay ``max_wait``.
+        """
+        batch = [await self._queue.get()]
+        await asyncio.sleep(0)
+        if self._queue.empty():
+            return batch
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            while len(batch) < self.max_batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            remaining = deadline - time.monotonic()
+            if len(batch) >= self.max_batch_size or remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout=remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _evaluate(self, batch):
+        # Requests routed to different model versions (A/B) are evaluated separately
+        groups = {}
+        for serving, input_dict, timings, future in batch:
+            groups.setdefault(serving, []).append((input_dict, timings, future))
+
+        for serving, items in groups.items():
+            # Callers that were cancelled while waiting are left out
+            items = [item for item in items if not item[2].done()]
+            if not items:
+                continue
+            started = time.perf_counter()
+            try:
+                results = await self._predict_many(serving, [input_dict for input_dict, _, _ in items])
+            except Exception as e:
+                self.errors += 1
+                for _, _, future in items:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            elapsed = time.perf_counter() - started
+            if self._on_batch is not None:
+                self._on_batch(len(items), elapsed)
+            for (_, timings, future), result in zip(items, results):
+                if timings is not None:
+                    timings["batch_share"] = elapsed * 1000 / len(items)
+                if not future.done():
+                    future.set_result(result)
+
+    async def _run(self):
+        while True:
+            batch = await self._next_batch()
+            self.requests += len(batch)
+            self.batches += 1
+            self.max_seen_batch_size = max(self.max_seen_batch_size, len(batch))
+            try:
+                await self._evaluate(batch)
+            except asyncio.CancelledError:
+                for _, _, _, future in batch:
+                    future.cancel()
+                raise
+
+    async def stop(self):
+        """Cancel the worker and fail any request still waiting in the queue."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        while not self._queue.empty():
+            _, _, _, future = self._queue.get_nowait()
+            if not future.done():
+                future.set_exception(RuntimeError("Micro-batcher stopped"))
+
+    def stats(self):
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "queue_depth": self._queue.qsize(),
+            "requests": self.requests,
+            "batches": self.batches,
+            "avg_batch_size": round(self.requests / self.batches, 2) if self.batches else 0,
+            "max_seen_batch_size": self.max_seen_batch_size,
+            "errors": self.errors,
+        }
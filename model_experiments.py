@@ -0,0 +1,179 @@
+import random
+import time
+from collections import deque
+
+
+def parse_weights(value):
+    """Parse "version=0.1,other=0.05" into {"version": 0.1, "other": 0.05}."""
+    weights = {}
+    for item in filter(None, (part.strip() for part in (value or "").split(","))):
+        version, _, weight = item.partition("=")
+        weights[version.strip()] = float(weight)
+    return weights
+
+
+class LatencyStats:
+    """Count, mean and max of a latency series plus percentiles over the most recent samples."""
+
+    def __init__(self, window=1024):
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.recent = deque(maxlen=window)
+
+    def add(self, ms):
+        self.count += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+        self.recent.append(ms)
+
+    @property
+    def mean_ms(self):
+        return self.total_ms / self.count if self.count else None
+
+    def stats(self):
+        recent = sorted(self.recent)
+
+        def percentile(q):
+            return round(recent[min(len(recent) - 1, int(q * len(recent)))], 3) if recent else None
+
+        return {
+            "count": self.count,
+            "mean_ms": round(self.mean_ms, 3) if self.count else None,
+            "p50_ms": percentile(0.50),
+            "p95_ms": percentile(0.95),
+            "p99_ms": percentile(0.99),
+            "max_ms": round(self.max_ms, 3),
+        }
+
+
+class ExperimentRouter:
+    """
+    Weighted A/B routing between model versions and shadow evaluation of a
+    candidate version.
+
+    ``ab_weights`` maps versions to the fraction of requests they serve; the
+    primary (active) version serves whatever share is left. A ``shadow_fraction``
+    of requests is additionally mirrored to ``shadow_version``, whose answer is
+    only compared with the one returned to the client. At most
+    ``max_shadow_pending`` mirrored requests are in flight, further ones are
+    skipped so shadow traffic can never pile up behind a slow candidate.
+    """
+
+    def __init__(self, ab_weights=None, shadow_version=None, shadow_fraction=0.0,
+                 max_shadow_pending=64, seed=None):
+        self._random = random.Random(seed)
+        self.max_shadow_pending = max_shadow_pending
+        self.shadow_pending = 0
+        self.started = time.monotonic()
+        self.versions = {}
+        self.shadows = {}
+        self.configure(ab_weights or {}, shadow_version, shadow_fraction)
+
+    def configure(self, ab_weights, shadow_version=None, shadow_fraction=0.0):
+        if any(weight < 0 for weight in ab_weights.values()) or sum(ab_weights.values()) > 1:
+            raise ValueError("A/B weights must be non-negative and sum to at most 1")
+        if not 0.0 <= shadow_fraction <= 1.0:
+            raise ValueError("Shadow fraction must be between 0 and 1")
+        self.ab_weights = {version: weight for version, weight in ab_weights.items() if weight > 0}
+        self.shadow_version = shadow_version
+        self.shadow_fraction = shadow_fraction if shadow_version else 0.0
+
+    @property
+    def required_versions(self):
+        """Versions that have to be loaded besides the primary one."""
+        return set(self.ab_weights) | ({self.shadow_version} if self.shadow_version else set())
+
+    def choose(self, primary_version):
+        """Pick the version that answers the next request."""
+        if not self.ab_weights:
+            return primary_version
+        draw = self._random.random()
+        for version, weight in self.ab_weights.items():
+            if draw < weight:
+                return version
+            draw -= weight
+        return primary_version
+
+    def should_shadow(self, served_version):
+        """Decide whether to mirror a request answered by ``served_version``; call ``shadow_done`` afterwards."""
+        if self.shadow_fraction <= 0 or served_version == self.shadow_version or \
+                self._random.random() >= self.shadow_fraction:
+            return False
+        if self.shadow_pending >= self.max_shadow_pending:
+            self._shadow_counters(self.shadow_version)["skipped"] += 1
+            return False
+        self.shadow_pending += 1
+        return True
+
+    def shadow_done(self):
+        self.shadow_pending -= 1
+
+    def _version_counters(self, version):
+        if version not in self.versions:
+            self.versions[version] = {"requests": 0, "rows": 0, "latency": LatencyStats()}
+        return self.versions[version]
+
+    def _shadow_counters(self, version):
+        if version not in self.shadows:
+            self.shadows[version] = {
+                "mirrored": 0, "agreed": 0, "errors": 0, "skipped": 0,
+                "primary_latency": LatencyStats(), "candidate_latency": LatencyStats(),
+            }
+        return self.shadows[version]
+
+    def record_request(self, version, rows, latency_ms):
+        counters = self._version_counters(version)
+        counters["requests"] += 1
+        counters["rows"] += rows
+        counters["latency"].add(latency_ms)
+
+    def record_shadow(self, version, agreed, primary_ms, candidate_ms):
+        """
+        Record one mirrored request. Latencies are only compared when the
+        primary answer was computed rather than served from the cache
+        (``primary_ms`` is None otherwise).
+        """
+        counters = self._shadow_counters(version)
+        counters["mirrored"] += 1
+        counters["agreed"] += int(agreed)
+        if primary_ms is not None:
+            counters["primary_latency"].add(primary_ms)
+            counters["candidate_latency"].add(candidate_ms)
+
+    def record_shadow_error(self, version):
+        self._shadow_counters(version)["errors"] += 1
+
+    def stats(self):
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        versions = {
+            version: {
+                "requests": counters["requests"],
+                "rows": counters["rows"],
+                "requests_per_second": round(counters["requests"] / elapsed, 3),
+                "latency": counters["latency"].stats(),
+            }
+            for version, counters in self.versions.items()
+        }
+        shadows = {}
+        for version, counters in self.shadows.items():
+            primary, candidate = counters["primary_latency"], counters["candidate_latency"]
+            shadows[version] = {
+                "mirrored": counters["mirrored"],
+                "agreed": counters["agreed"],
+                "agreement_rate": round(counters["agreed"] / counters["mirrored"], 4) if counters["mirrored"] else None,
+                "errors": counters["errors"],
+                "skipped": counters["skipped"],
+                "primary_latency": primary.stats(),
+                "candidate_latency": candidate.stats(),
+                "mean_latency_delta_ms": round(candidate.mean_ms - primary.mean_ms, 3) if primary.count else None,
+            }
+        return {
+            "ab_weights": self.ab_weights,
+            "shadow_version": self.shadow_version,
+            "shadow_fraction": self.shadow_fraction,
+            "shadow_pending": self.shadow_pending,
+            "uptime_seconds": round(elapsed, 1),
+            "versions": versions,
+            "shadow": shadows,
+        }
@@ -0,0 +1,93 @@
+import datetime
+import json
+import os
+import shutil
+import tempfile
+import uuid
+
+# Layout:
+#   models/
+#     CURRENT                      <- name of the version the API should serve
+#     20250101-120000-1a2b3c/
+#       model.pkl
+#       preprocessor.pkl
+#       metadata.json
+
+CURRENT_FILE = 'CURRENT'
+MODEL_FILE = 'model.pkl'
+PREPROCESSOR_FILE = 'preprocessor.pkl'
+METADATA_FILE = 'metadata.json'
+
+
+def new_version_id():
+    return f"{datetime.datetime.utcnow():%Y%m%d-%H%M%S}-{uuid.uuid4().hex[:6]}"
+
+
+def version_dir(registry_dir, version):
+    return os.path.join(registry_dir, version)
+
+
+def publish(registry_dir, model, preprocessor, metadata, activate=True):
+    """
+    Store a model/preprocessor pair as a new immutable version. The files are
+    written to a staging directory first, so a version directory is always
+    complete, and CURRENT is only repointed after the rename.
+    """
+    import joblib
+
+    os.makedirs(registry_dir, exist_ok=True)
+    version = new_version_id()
+    staging = tempfile.mkdtemp(prefix='.staging-', dir=registry_dir)
+    try:
+        joblib.dump(model, os.path.join(staging, MODEL_FILE))
+        joblib.dump(preprocessor, os.path.join(staging, PREPROCESSOR_FILE))
+        with open(os.path.join(staging, METADATA_FILE), 'w') as f:
+            json.dump({**metadata, 'version': version}, f, indent=2)
+        os.replace(staging, version_dir(registry_dir, version))
+    except Exception:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    if activate:
+        set_current_version(registry_dir, version)
+    return version
+
+
+def set_current_version(registry_dir, version):
+    if not os.path.isfile(os.path.join(version_dir(registry_dir, version), MODEL_FILE)):
+        raise ValueError(f"Unknown model version: {version}")
+    pointer = os.path.join(registry_dir, CURRENT_FILE)
+    with tempfile.NamedTemporaryFile('w', dir=registry_dir, delete=False) as f:
+        f.write(version)
+    os.replace(f.name, pointer)
+
+
+def current_version(registry_dir):
+    try:
+        with open(os.path.join(registry_dir, CURRENT_FILE)) as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+def list_versions(registry_dir):
+    """All complete versions, oldest first, with their metadata."""
+    if not os.path.isdir(registry_dir):
+        return []
+    versions = []
+    for name in sorted(os.listdir(registry_dir)):
+        path = version_dir(registry_dir, name)
+        if name.startswith('.') or not os.path.isfile(os.path.join(path, MODEL_FILE)):
+            continue
+        try:
+            with open(os.path.join(path, METADATA_FILE)) as f:
+                metadata = json.load(f)
+        except (OSError, ValueError):
+            metadata = {}
+        versions.append({'version': name, **metadata})
+    return versions
+
+
+def version_paths(registry_dir, version):
+    """(model_path, preprocessor_path) of a stored version."""
+    path = version_dir(registry_dir, version)
+    return os.path.join(path, MODEL_FILE), os.path.join(path, PREPROCESSOR_FILE)
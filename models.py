@@ -1,3 +1,5 @@
+import datetime
+
 from pydantic import BaseModel, Field
 from typing import Optional
 from bson import ObjectId
@@ -20,7 +22,7 @@ class PyObjectId(ObjectId):
 class LearningStyleDB(BaseModel):
     id: PyObjectId = Field(default_factory=PyObjectId, alias="_id")
     learning_style: str
-    predicted_at: str
+    predicted_at: datetime.datetime
     user_data: dict
 
     class Config:
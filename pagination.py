@@ -0,0 +1,76 @@
+import base64
+import datetime
+import json
+
+from bson import ObjectId
+
+from features import STYLE_NAMES
+
+# Fields a /predictions caller may project; _id and predicted_at are always
+# returned because the page cursors are built from them
+PREDICTION_FIELDS = {"prediction_id", "learning_style", "predicted_at", "user_data", "probabilities"}
+
+
+def encode_cursor(document):
+    """Opaque page token pointing at a document's (predicted_at, _id) sort key."""
+    predicted_at = document["predicted_at"]
+    # "d" marks a native date; "t" an ISO string from before timestamps were stored natively
+    key = "d" if isinstance(predicted_at, datetime.datetime) else "t"
+    if key == "d":
+        predicted_at = predicted_at.isoformat()
+    payload = json.dumps({key: predicted_at, "id": str(document["_id"])}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(token):
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if "d" in payload:
+            return datetime.datetime.fromisoformat(payload["d"]), ObjectId(payload["id"])
+        return payload["t"], ObjectId(payload["id"])
+    except Exception:
+        raise ValueError("Invalid page cursor")
+
+
+def keyset_filter(token, direction):
+    """
+    Match documents strictly older ("before") or newer ("after") than the cursor
+    in (predicted_at, _id) order, which the compound index serves as a range scan.
+    """
+    predicted_at, object_id = decode_cursor(token)
+    op = "$lt" if direction == "before" else "$gt"
+    clauses = [
+        {"predicted_at": {op: predicted_at}},
+        {"predicted_at": predicted_at, "_id": {op: object_id}},
+    ]
+    # Range operators only match the cursor's BSON type, and legacy ISO strings
+    # sort before every date, so the other type is added on the side it sorts to
+    if direction == "before" and isinstance(predicted_at, datetime.datetime):
+        clauses.append({"predicted_at": {"$type": "string"}})
+    elif direction == "after" and isinstance(predicted_at, str):
+        clauses.append({"predicted_at": {"$type": "date"}})
+    return {"$or": clauses}
+
+
+def parse_projection(fields):
+    """Turn a comma-separated field list into a Mongo projection (None means all fields)."""
+    if not fields:
+        return None
+    requested = {field.strip() for field in fields.split(",") if field.strip()}
+    unknown = requested - PREDICTION_FIELDS
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+    projection = {field: 1 for field in requested}
+    projection["predicted_at"] = 1
+    return projection
+
+
+def parse_learning_style(value):
+    """Accept a style index ("2") or name ("Kinesthetic") and return the stored index."""
+    if value.isdigit() and int(value) < len(STYLE_NAMES):
+        return int(value)
+    for idx, name in enumerate(STYLE_NAMES):
+        if name.lower() == value.lower():
+            return idx
+    raise ValueError(f"Unknown learning style: {value}")
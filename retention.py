@@ -0,0 +1,281 @@
+"""
+Retention and time-series rollups for the predictions collection.
+
+Raw predictions carry the full request, so they are only kept for a while: a
+TTL index on ``predicted_at`` drops them ``raw_days`` after they were made.
+The index is only created once compaction has caught up with the existing
+history. Before that, ``RetentionJob`` compacts them into the ``prediction_rollups``
+collection, one document per (granularity, bucket_start, learning_style):
+
+    {"granularity": "hour", "bucket_start": datetime(2026, 10, 18, 13),
+     "learning_style": 2, "count": 130, "probability_sums": [12.4, 20.1, 85.3, 12.2]}
+
+``probability_sums[i]`` sums the probability of STYLE_NAMES[i] over the
+bucket's predictions of ``learning_style``, so counts and mean probabilities
+stay available after the raw documents are gone. Daily rollups are kept;
+hourly ones expire after ``hourly_days``.
+
+The job moves a watermark (``compacted_until``) forward one day at a time.
+Every window is recomputed from the raw documents and written with $set, so a
+run that dies part-way repeats the window without double counting. A lease
+on the state document keeps several API processes from compacting at once.
+"""
+import datetime
+import uuid
+
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+from features import STYLE_NAMES
+
+ROLLUPS_COLLECTION = "prediction_rollups"
+STATE_COLLECTION = "retention_state"
+STATE_ID = "predictions"
+RAW_TTL_INDEX = "predicted_at_ttl"
+HOURLY_TTL_INDEX = "hourly_rollups_ttl"
+
+HOUR = datetime.timedelta(hours=1)
+DAY = datetime.timedelta(days=1)
+
+
+def truncate(value, unit):
+    """Start of the hour or day containing a naive UTC datetime."""
+    value = value.replace(minute=0, second=0, microsecond=0)
+    return value.replace(hour=0) if unit == "day" else value
+
+
+def bucket_pipeline(match, date, unit, count, probabilities):
+    """Group into (bucket, learning_style) counts and per-style probability sums."""
+    return [
+        {"$match": match},
+        {"$group": {
+            "_id": {
+                "bucket": {"$dateTrunc": {"date": date, "unit": unit}},
+                "learning_style": "$learning_style",
+            },
+            "count": {"$sum": count},
+            **{f"p{idx}": {"$sum": {"$arrayElemAt": [probabilities, idx]}} for idx in range(len(STYLE_NAMES))},
+        }},
+    ]
+
+
+def raw_buckets(match, unit):
+    # $toDate also reads ISO-string timestamps written before they were stored natively
+    return bucket_pipeline(match, {"$toDate": "$predicted_at"}, unit, 1, "$probabilities")
+
+
+def rollup_buckets(match, unit):
+    return bucket_pipeline(match, "$bucket_start", unit, "$count", "$probability_sums")
+
+
+def bucket_row(row):
+    """Unpack a ``bucket_pipeline`` result into (bucket_start, learning_style, count, probability_sums)."""
+    return (row["_id"]["bucket"], row["_id"]["learning_style"], row["count"],
+            [row[f"p{idx}"] for idx in range(len(STYLE_NAMES))])
+
+
+async def read_watermark(database):
+    """Predictions before this time are in the rollups (None until the first compaction)."""
+    state = await database[STATE_COLLECTION].find_one({"_id": STATE_ID}, {"compacted_until": 1})
+    return state.get("compacted_until") if state else None
+
+
+async def ensure_ttl_index(collection, name, field, seconds, **options):
+    """Create, retune or (with ``seconds`` of 0) drop a single-field TTL index."""
+    existing = (await collection.index_information()).get(name)
+    if not seconds:
+        if existing is not None:
+            await collection.drop_index(name)
+    elif existing is None:
+        await collection.create_index([(field, 1)], name=name, expireAfterSeconds=seconds, **options)
+    elif existing.get("expireAfterSeconds") != seconds:
+        # Changing the expiry doesn't need an index rebuild
+        await collection.database.command(
+            "collMod", collection.name, index={"name": name, "expireAfterSeconds": seconds})
+
+
+class RetentionJob:
+    """
+    Compacts raw predictions older than ``compact_after_hours`` into hourly and
+    daily rollups, and keeps the TTL indexes in line with ``raw_days`` and
+    ``hourly_days`` (0 keeps documents indefinitely).
+
+    Raw documents must outlive the compaction delay by at least a day, and
+    hourly rollups must outlive it by two (a day's rollup is summed from its
+    hours), or history would expire before it is compacted.
+    """
+
+    def __init__(self, database, raw_days=30, compact_after_hours=24, hourly_days=90,
+                 lease_seconds=600, migrate_batch_size=1000):
+        if raw_days and raw_days * 24 < compact_after_hours + 24:
+            raise ValueError("Raw predictions must be kept at least a day longer than the compaction delay")
+        if hourly_days and hourly_days * 24 < compact_after_hours + 48:
+            raise ValueError("Hourly rollups must be kept at least two days longer than the compaction delay")
+        self.database = database
+        self.predictions = database["predictions"]
+        self.rollups = database[ROLLUPS_COLLECTION]
+        self.state = database[STATE_COLLECTION]
+        self.raw_days = raw_days
+        self.compact_after = datetime.timedelta(hours=compact_after_hours)
+        self.hourly_days = hourly_days
+        self.lease = datetime.timedelta(seconds=lease_seconds)
+        self.migrate_batch_size = migrate_batch_size
+        self.owner = str(uuid.uuid4())
+        self._indexes_ready = False
+        self.raw_ttl_ready = False
+
+        self.runs = 0
+        self.failed_runs = 0
+        self.skipped_runs = 0
+        self.migrated = 0
+        self.compacted_hours = 0
+        self.rollups_written = 0
+        self.compacted_until = None
+        self.last_run_at = None
+        self.last_error = None
+
+    async def ensure_indexes(self):
+        await self.rollups.create_index(
+            [("granularity", 1), ("bucket_start", 1), ("learning_style", 1)], unique=True)
+        await ensure_ttl_index(self.rollups, HOURLY_TTL_INDEX, "bucket_start", self.hourly_days * 86400,
+                               partialFilterExpression={"granularity": "hour"})
+        self._indexes_ready = True
+
+    async def ensure_raw_ttl(self, now):
+        """
+        Create or retune the raw TTL index, but only once compaction has caught
+        up to within ``raw_days`` of ``now``: on a first run over existing
+        history, or when ``raw_days`` is shortened, the TTL monitor would
+        otherwise drop predictions the backfill hasn't rolled up yet. Returns
+        whether the index is in line with ``raw_days``.
+        """
+        if self.raw_days and self.compacted_until is not None and \
+                self.compacted_until < now - datetime.timedelta(days=self.raw_days):
+            return False
+        await ensure_ttl_index(self.predictions, RAW_TTL_INDEX, "predicted_at", self.raw_days * 86400)
+        return True
+
+    async def run_once(self, now=None):
+        """One pass: migrate legacy timestamps, then compact up to the cutoff. None if another process holds the lease."""
+        now = now or datetime.datetime.utcnow()
+        if not await self._acquire_lease(now):
+            self.skipped_runs += 1
+            return None
+        try:
+            if not self._indexes_ready:
+                await self.ensure_indexes()
+            migrated = await self.migrate_legacy_timestamps()
+            hours = await self.compact(truncate(now - self.compact_after, "hour"))
+            self.raw_ttl_ready = await self.ensure_raw_ttl(now)
+        except Exception as e:
+            self.failed_runs += 1
+            self.last_error = str(e)
+            raise
+        finally:
+            await self._release_lease()
+        self.runs += 1
+        self.last_run_at = now
+        return {"migrated": migrated, "compacted_hours": hours, "compacted_until": self.compacted_until}
+
+    async def migrate_legacy_timestamps(self):
+        """Rewrite ISO-string ``predicted_at`` values as dates so the TTL index and rollups cover them."""
+        migrated, last_id = 0, None
+        while True:
+            query = {"predicted_at": {"$type": "string"}}
+            if last_id is not None:
+                query["_id"] = {"$gt": last_id}
+            documents = await self.predictions.find(query, {"predicted_at": 1}) \
+                .sort("_id", 1).limit(self.migrate_batch_size).to_list(length=self.migrate_batch_size)
+            if not documents:
+                break
+            last_id = documents[-1]["_id"]
+            updates = []
+            for document in documents:
+                try:
+                    predicted_at = datetime.datetime.fromisoformat(document["predicted_at"])
+                except ValueError:
+                    continue  # left as is; unparseable values are never compacted
+                updates.append(UpdateOne({"_id": document["_id"]}, {"$set": {"predicted_at": predicted_at}}))
+            if updates:
+                await self.predictions.bulk_write(updates, ordered=False)
+                migrated += len(updates)
+        self.migrated += migrated
+        return migrated
+
+    async def compact(self, cutoff):
+        """Roll up every whole hour before ``cutoff`` that is past the watermark; returns the hours covered."""
+        watermark = await read_watermark(self.database)
+        if watermark is None:
+            first = await self.predictions.find_one(
+                {"predicted_at": {"$type": "date"}}, {"predicted_at": 1}, sort=[("predicted_at", 1)])
+            if first is None:
+                return 0
+            watermark = truncate(first["predicted_at"], "hour")
+
+        hours = 0
+        while watermark < cutoff:
+            window_end = min(truncate(watermark, "day") + DAY, cutoff)
+            await self._compact_window(watermark, window_end)
+            hours += int((window_end - watermark) / HOUR)
+            watermark = window_end
+            await self.state.update_one({"_id": STATE_ID}, {"$set": {"compacted_until": watermark}}, upsert=True)
+        self.compacted_hours += hours
+        self.compacted_until = watermark
+        return hours
+
+    async def _compact_window(self, start, end):
+        """Hourly rollups for [start, end), then the day's rollup re-summed from all of its hours."""
+        rows = await self.predictions.aggregate(
+            raw_buckets({"predicted_at": {"$gte": start, "$lt": end}}, "hour")).to_list(length=None)
+        await self._write_rollups("hour", rows)
+
+        day = truncate(start, "day")
+        rows = await self.rollups.aggregate(rollup_buckets(
+            {"granularity": "hour", "bucket_start": {"$gte": day, "$lt": day + DAY}}, "day")).to_list(length=None)
+        await self._write_rollups("day", rows)
+
+    async def _write_rollups(self, granularity, rows):
+        updates = []
+        for row in rows:
+            bucket_start, learning_style, count, probability_sums = bucket_row(row)
+            updates.append(UpdateOne(
+                {"granularity": granularity, "bucket_start": bucket_start, "learning_style": learning_style},
+                {"$set": {"count": count, "probability_sums": probability_sums}},
+                upsert=True,
+            ))
+        if updates:
+            await self.rollups.bulk_write(updates, ordered=False)
+            self.rollups_written += len(updates)
+
+    async def _acquire_lease(self, now):
+        # Matches the state document only while its lease is free; when another
+        # process holds it, the upsert collides on _id instead
+        try:
+            await self.state.update_one(
+                {"_id": STATE_ID, "$or": [{"lease_until": None}, {"lease_until": {"$lt": now}}]},
+                {"$set": {"lease_until": now + self.lease, "lease_owner": self.owner}},
+                upsert=True,
+            )
+        except DuplicateKeyError:
+            return False
+        return True
+
+    async def _release_lease(self):
+        await self.state.update_one({"_id": STATE_ID, "lease_owner": self.owner}, {"$set": {"lease_until": None}})
+
+    def stats(self):
+        return {
+            "raw_days": self.raw_days,
+            "compact_after_hours": self.compact_after / HOUR,
+            "hourly_days": self.hourly_days,
+            "raw_ttl_ready": self.raw_ttl_ready,
+            "compacted_until": self.compacted_until.isoformat() if self.compacted_until else None,
+            "runs": self.runs,
+            "failed_runs": self.failed_runs,
+            "skipped_runs": self.skipped_runs,
+            "migrated": self.migrated,
+            "compacted_hours": self.compacted_hours,
+            "rollups_written": self.rollups_written,
+            "last_run_at": self.last_run_at.isoformat() if self.last_run_at else None,
+            "last_error": self.last_error,
+        }
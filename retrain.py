@@ -0,0 +1,245 @@
+"""
+Incremental retraining from labelled predictions.
+
+Predictions that received feedback (POST /predictions/{id}/feedback) since the
+serving model was trained are streamed out of MongoDB in batches:
+
+1. A first pass builds per-feature histograms and compares them with the
+   training data (population stability index). When a feature drifted beyond
+   --drift-threshold the old trees describe a different population, so a full
+   retrain on the training data plus all feedback is worth its cost.
+2. Otherwise a second pass warm-starts the current forest: each batch adds
+   --trees-per-batch trees fitted on the batch plus a replay sample of the
+   original training rows (so every class is present and old patterns are not
+   forgotten). The oldest trees are dropped beyond --max-trees.
+
+The updated model's serving cost is measured again and checked against the
+base model's budget (or --max-latency-ms / --max-model-mb); an over-budget
+model is not published without --force. The result is published to the model
+registry and only made CURRENT with --activate when its accuracy on held-out
+feedback does not drop.
+"""
+import argparse
+import copy
+import datetime
+import os
+
+import joblib
+import numpy as np
+import pandas as pd
+import sklearn
+from pymongo import MongoClient
+from sklearn.metrics import accuracy_score
+
+import model_registry
+from d_t import build_preprocessor, fit_forest, measure_serving_cost, within_budget
+from dataset import load_training_split
+from features import FEATURE_COLUMNS, FEATURE_RANGES
+from serving import export_compiled_artifact
+
+MONGODB_URL = os.getenv("MONGODB_URL", "mongodb://localhost:27017")
+DATABASE_NAME = "admin"
+
+# Every HOLDOUT_EVERY-th labelled record is kept for evaluation only
+HOLDOUT_EVERY = 5
+FOREST_PARAMS = ('n_estimators', 'max_depth', 'min_samples_leaf', 'max_features', 'random_state')
+# Base metadata that describes the training search, not the updated model
+SEARCH_KEYS = ('version', 'cv_folds', 'cv_accuracy', 'cv_std', 'n_candidates', 'search_seconds', 'results_file')
+
+
+def feature_bins(column):
+    """Histogram edges: one bin per value for small ranges, ten equal-width bins otherwise."""
+    low, high = FEATURE_RANGES[column]
+    if high - low <= 10:
+        return np.arange(low, high + 2) - 0.5
+    return np.linspace(low, high + 1, 11)
+
+
+def histograms(X):
+    return {column: np.histogram(X[column], bins=feature_bins(column))[0] for column in FEATURE_COLUMNS}
+
+
+def population_stability_index(expected_counts, actual_counts, eps=1e-4):
+    expected = np.maximum(expected_counts / max(expected_counts.sum(), 1), eps)
+    actual = np.maximum(actual_counts / max(actual_counts.sum(), 1), eps)
+    return float(np.sum((actual - expected) * np.log(actual / expected)))
+
+
+def drift_report(reference_counts, current_counts, threshold):
+    psi = {
+        column: round(population_stability_index(reference_counts[column], current_counts[column]), 4)
+        for column in FEATURE_COLUMNS
+    }
+    drifted = sorted(column for column, value in psi.items() if value > threshold)
+    return {"psi": psi, "max_psi": max(psi.values()), "threshold": threshold, "drifted_features": drifted}
+
+
+def stream_feedback(collection, since, batch_size):
+    """Yield (X, y, last_feedback_at) batches of labelled predictions newer than ``since``."""
+    query = {"feedback_style": {"$exists": True}}
+    if since:
+        query["feedback_at"] = {"$gt": since}
+    cursor = collection.find(query, {"user_data": 1, "feedback_style": 1, "feedback_at": 1}) \
+        .sort("feedback_at", 1).batch_size(batch_size)
+
+    documents = []
+    for document in cursor:
+        documents.append(document)
+        if len(documents) == batch_size:
+            yield to_batch(documents)
+            documents = []
+    if documents:
+        yield to_batch(documents)
+
+
+def to_batch(documents):
+    X = pd.DataFrame([document["user_data"] for document in documents], columns=FEATURE_COLUMNS).astype(np.int8)
+    y = np.array([document["feedback_style"] for document in documents])
+    return X, y, documents[-1]["feedback_at"]
+
+
+def load_base_model(registry_dir):
+    """The model CURRENT in the registry, or the local model.pkl, with its metadata."""
+    version = model_registry.current_version(registry_dir)
+    if version is None:
+        return "local", joblib.load('model.pkl'), joblib.load('preprocessor.pkl'), {}
+    model_path, preprocessor_path = model_registry.version_paths(registry_dir, version)
+    metadata = next((v for v in model_registry.list_versions(registry_dir) if v['version'] == version), {})
+    return version, joblib.load(model_path), joblib.load(preprocessor_path), metadata
+
+
+def warm_start_update(model, X_new, y_new, X_replay, y_replay, n_trees, max_trees, rng, n_jobs):
+    """Add ``n_trees`` trees fitted on new plus replayed rows and keep at most ``max_trees``."""
+    replay = rng.choice(len(y_replay), size=min(len(y_replay), len(y_new)), replace=False)
+    X_fit = np.vstack([X_new, X_replay[replay]])
+    y_fit = np.concatenate([y_new, y_replay[replay]])
+
+    classes = model.classes_
+    model.set_params(warm_start=True, n_estimators=len(model.estimators_) + n_trees, n_jobs=n_jobs)
+    model.fit(X_fit, y_fit)
+    if not np.array_equal(model.classes_, classes):
+        raise ValueError(f"Classes changed during the update: {classes} -> {model.classes_}")
+
+    if len(model.estimators_) > max_trees:
+        model.estimators_ = model.estimators_[-max_trees:]
+    model.set_params(warm_start=False, n_estimators=len(model.estimators_), n_jobs=None)
+    return model
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Update the serving forest from labelled predictions.")
+    parser.add_argument('--registry', type=str, default='models', help="Model registry directory")
+    parser.add_argument('--batch-size', type=int, default=5000, help="Labelled records per streamed batch")
+    parser.add_argument('--trees-per-batch', type=int, default=10, help="Trees added for every batch")
+    parser.add_argument('--max-trees', type=int, default=300, help="Oldest trees are dropped beyond this")
+    parser.add_argument('--min-records', type=int, default=200, help="Do nothing with fewer new labelled records")
+    parser.add_argument('--drift-threshold', type=float, default=0.2, help="PSI above which a full retrain is run")
+    parser.add_argument('--max-accuracy-drop', type=float, default=0.01, help="Allowed drop on held-out feedback")
+    parser.add_argument('--max-latency-ms', type=float, default=None,
+                        help="Serving latency budget (defaults to the base model's)")
+    parser.add_argument('--max-model-mb', type=float, default=None, help="Model size budget (defaults to the base model's)")
+    parser.add_argument('--force', action='store_true', help="Publish even if the updated model is over budget")
+    parser.add_argument('--activate', action='store_true', help="Make the new version current if it passes")
+    parser.add_argument('--n-jobs', type=int, default=-1)
+    args = parser.parse_args()
+
+    base_version, model, preprocessor, base_metadata = load_base_model(args.registry)
+    since = base_metadata.get('last_feedback_at')
+    collection = MongoClient(MONGODB_URL, serverSelectionTimeoutMS=5000)[DATABASE_NAME]["predictions"]
+    split = load_training_split(build_preprocessor)
+    print(f"Base model {base_version} ({len(model.estimators_)} trees), feedback since {since or 'the beginning'}")
+
+    # Pass 1: feature histograms of the new records only, in constant memory
+    counts = {column: 0 for column in FEATURE_COLUMNS}
+    n_records = 0
+    for X, _, _ in stream_feedback(collection, since, args.batch_size):
+        batch_counts = histograms(X)
+        counts = {column: counts[column] + batch_counts[column] for column in FEATURE_COLUMNS}
+        n_records += len(X)
+    if n_records < args.min_records:
+        print(f"Only {n_records} new labelled records (minimum {args.min_records}); nothing to do.")
+        return
+    drift = drift_report(histograms(split.X_train), counts, args.drift_threshold)
+    full_retrain = bool(drift["drifted_features"])
+    print(f"{n_records} new labelled records, max PSI {drift['max_psi']:.3f}"
+          + (f" - drift in {drift['drifted_features']}, running a full retrain" if full_retrain else
+             " - updating incrementally"))
+
+    # Pass 2: train, holding every HOLDOUT_EVERY-th record out for evaluation
+    base_model = copy.deepcopy(model)
+    rng = np.random.default_rng(0)
+    holdout_X, holdout_y, train_X, train_y = [], [], [], []
+    last_feedback_at = since
+    for X, y, last_feedback_at in stream_feedback(collection, since, args.batch_size):
+        X_processed = preprocessor.transform(X)
+        held_out = np.arange(len(y)) % HOLDOUT_EVERY == 0
+        holdout_X.append(X_processed[held_out])
+        holdout_y.append(y[held_out])
+        if full_retrain:
+            train_X.append(X_processed[~held_out])
+            train_y.append(y[~held_out])
+        else:
+            model = warm_start_update(model, X_processed[~held_out], y[~held_out],
+                                      split.X_train_processed, split.y_train,
+                                      args.trees_per_batch, args.max_trees, rng, args.n_jobs)
+    if full_retrain:
+        params = {name: value for name, value in base_model.get_params().items() if name in FOREST_PARAMS}
+        model = fit_forest(params, np.vstack([split.X_train_processed] + train_X),
+                           np.concatenate([split.y_train] + train_y), args.n_jobs)
+
+    holdout_X, holdout_y = np.vstack(holdout_X), np.concatenate(holdout_y)
+    scores = {
+        "base_feedback_accuracy": accuracy_score(holdout_y, base_model.predict(holdout_X)),
+        "feedback_accuracy": accuracy_score(holdout_y, model.predict(holdout_X)),
+        "base_test_accuracy": accuracy_score(split.y_test, base_model.predict(split.X_test_processed)),
+        "test_accuracy": accuracy_score(split.y_test, model.predict(split.X_test_processed)),
+    }
+    print(", ".join(f"{name}={value:.4f}" for name, value in scores.items()))
+    passed = scores["feedback_accuracy"] >= scores["base_feedback_accuracy"] - args.max_accuracy_drop
+
+    # Added trees make the forest slower to serve, so the budget is checked again
+    base_budget = base_metadata.get('budget') or {}
+    budget = {
+        'max_latency_ms': args.max_latency_ms if args.max_latency_ms is not None else base_budget.get('max_latency_ms'),
+        'max_model_mb': args.max_model_mb if args.max_model_mb is not None else base_budget.get('max_model_mb'),
+    }
+    serving_cost = measure_serving_cost(model, split.X_test_processed)
+    fits_budget = within_budget(serving_cost, **budget)
+    print(f"Serving cost: {serving_cost}")
+    if not fits_budget and not args.force:
+        print(f"Not publishing: the updated model is over the serving budget {budget} (use --force to publish anyway).")
+        return
+
+    metadata = {
+        **{k: v for k, v in base_metadata.items() if k not in SEARCH_KEYS},
+        'trained_at': datetime.datetime.utcnow().isoformat(),
+        'test_accuracy': scores["test_accuracy"],
+        'budget': budget,
+        'within_budget': bool(fits_budget),
+        'serving_cost': serving_cost,
+        'sklearn_version': sklearn.__version__,
+        'params': {**(base_metadata.get('params') or {}), 'n_estimators': len(model.estimators_)},
+        'last_feedback_at': last_feedback_at,
+        'retrain': {
+            'mode': 'full' if full_retrain else 'warm_start',
+            'base_version': base_version,
+            'feedback_records': n_records,
+            'holdout_records': int(len(holdout_y)),
+            'drift': drift,
+            **scores,
+        },
+    }
+    version = model_registry.publish(args.registry, model, preprocessor, metadata, activate=False)
+    export_compiled_artifact(*model_registry.version_paths(args.registry, version),
+                             os.path.join(model_registry.version_dir(args.registry, version), 'compiled'))
+    if args.activate and passed:
+        model_registry.set_current_version(args.registry, version)
+    if passed:
+        print(f"Published {version}" + (" and made it current." if args.activate else "."))
+    else:
+        print(f"Published {version} but left {base_version} current: feedback accuracy dropped "
+              f"by more than {args.max_accuracy_drop}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,299 @@
+import logging
+import os
+import time
+
+import numpy as np
+
+from app_logging import log
+from features import FEATURE_COLUMNS, CompiledPreprocessor, sample_feature_matrix, to_feature_matrix
+from forest_engine import CompiledForest
+from lookup_table import LookupTable
+
+# joblib, pandas and scikit-learn are imported only when a pickle is loaded or
+# the sklearn path runs; serving from a compiled artifact needs none of them
+
+logger = logging.getLogger(__name__)
+
+PREPROCESSOR_ARRAY_PREFIX = 'preprocessor_'
+
+
+class ServingModel:
+    """
+    Everything needed to answer predictions with one model version: the sklearn
+    objects plus their compiled fast paths. Apart from unpickling the sklearn
+    objects on first use when they were not needed at load time, instances are
+    never mutated after loading, so the API swaps versions by replacing a
+    single reference.
+    """
+
+    def __init__(self, version, model, preprocessor, fast_preprocessor=None, compiled_forest=None,
+                 compiled_dir=None, compiled_max_rows=64, metadata=None, lookup=None,
+                 model_path=None, preprocessor_path=None, load_profile=None):
+        self.version = version
+        self._model = model
+        self._preprocessor = preprocessor
+        self.model_path = model_path
+        self.preprocessor_path = preprocessor_path
+        self.fast_preprocessor = fast_preprocessor
+        self.compiled_forest = compiled_forest
+        self.compiled_dir = compiled_dir
+        self.compiled_max_rows = compiled_max_rows
+        self.metadata = metadata or {}
+        self.lookup = lookup
+        self.load_profile = load_profile or {}
+        self._explainer = None
+        self.classes_ = model.classes_ if model is not None else np.asarray(compiled_forest.classes_)
+
+    @property
+    def model(self):
+        """The sklearn forest; unpickled on first access if it wasn't needed at load time."""
+        if self._model is None and self.model_path is not None:
+            import joblib
+            self._model = joblib.load(self.model_path)
+        return self._model
+
+    @property
+    def preprocessor(self):
+        if self._preprocessor is None and self.preprocessor_path is not None:
+            import joblib
+            self._preprocessor = joblib.load(self.preprocessor_path)
+        return self._preprocessor
+
+    def load_model(self):
+        """Unpickle the sklearn model now, e.g. in the background after the API is ready."""
+        return self.model
+
+    @property
+    def backend(self):
+        return "compiled" if self.compiled_forest is not None else "sklearn"
+
+    @property
+    def shared(self):
+        return self.compiled_forest is not None and isinstance(self.compiled_forest.value, np.memmap)
+
+    def preprocess_one(self, input_dict):
+        if self.fast_preprocessor is not None:
+            return self.fast_preprocessor.transform_one(input_dict)
+        import pandas as pd
+        return self.preprocessor.transform(pd.DataFrame([input_dict], columns=FEATURE_COLUMNS))
+
+    def preprocess_many(self, input_dicts):
+        if self.fast_preprocessor is not None:
+            return self.fast_preprocessor.transform(to_feature_matrix(input_dicts))
+        import pandas as pd
+        return self.preprocessor.transform(pd.DataFrame(input_dicts, columns=FEATURE_COLUMNS))
+
+    def predict_proba(self, processed_input):
+        # The compiled engine wins on per-call overhead; sklearn's Cython
+        # traversal wins once a batch has more than a few dozen rows. Until the
+        # sklearn model has been loaded the compiled engine answers every batch.
+        if self.compiled_forest is not None and \
+                (processed_input.shape[0] <= self.compiled_max_rows or self._model is None):
+            return self.compiled_forest.predict_proba(processed_input)
+        return self.model.predict_proba(processed_input)
+
+    def explain(self, input_dicts):
+        """
+        Per-feature contributions to the class probabilities of raw StudentData
+        dicts, from the tree-interpreter decomposition of the flattened forest.
+        Contributions of one-hot columns are summed back onto their source
+        field. Returns ``bias`` (n_classes,) and ``contributions`` with shape
+        (n_rows, len(FEATURE_COLUMNS), n_classes), columns in ``classes_`` order.
+        """
+        if self._explainer is None:
+            # The sklearn backend has no flattened forest yet; build it once
+            forest = self.compiled_forest if self.compiled_forest is not None else CompiledForest(self.model)
+            preprocessor = self.fast_preprocessor or CompiledPreprocessor(self.preprocessor)
+            # (processed column -> raw field) as a 0/1 matrix
+            sources = preprocessor.source_columns()
+            to_fields = np.zeros((len(sources), len(FEATURE_COLUMNS)), dtype=np.float64)
+            to_fields[np.flatnonzero(sources >= 0), sources[sources >= 0]] = 1.0
+            self._explainer = forest, preprocessor, to_fields
+
+        forest, preprocessor, to_fields = self._explainer
+        bias, contributions = forest.contributions(preprocessor.transform(to_feature_matrix(input_dicts)))
+        return bias, np.einsum('npc,pf->nfc', contributions, to_fields)
+
+    def warm_up(self):
+        """Run a few predictions so the first real request doesn't pay for lazy initialisation."""
+        rows = [dict(zip(FEATURE_COLUMNS, row)) for row in sample_feature_matrix(8)]
+        self.predict_proba(self.preprocess_one(rows[0]))
+        self.predict_proba(self.preprocess_many(rows))
+
+
+def file_fingerprint(path):
+    stat = os.stat(path)
+    return f"{stat.st_mtime_ns}-{stat.st_size}"
+
+
+def load_compiled_artifact(compiled_dir, model_path, preprocessor_path, mmap_mode='r'):
+    """
+    The compiled forest and preprocessor stored in ``compiled_dir``, or
+    (None, None) unless both were verified against the current model and
+    preprocessor files.
+    """
+    try:
+        forest = CompiledForest.load(compiled_dir, mmap_mode=mmap_mode)
+    except (OSError, ValueError, KeyError):
+        return None, None
+    meta = forest.meta
+    if not meta.get("verified") or meta.get("source") != file_fingerprint(model_path) or \
+            meta.get("preprocessor_source") != file_fingerprint(preprocessor_path):
+        return None, None
+    arrays = {
+        name[len(PREPROCESSOR_ARRAY_PREFIX):]: array
+        for name, array in forest.extra_arrays.items() if name.startswith(PREPROCESSOR_ARRAY_PREFIX)
+    }
+    return forest, CompiledPreprocessor.from_arrays(meta["preprocessor_features"], arrays)
+
+
+def save_compiled_artifact(compiled_dir, compiled_forest, fast_preprocessor, model_path, preprocessor_path):
+    """Write the verified forest and preprocessor arrays, keyed on the files they were built from."""
+    compiled_forest.save(
+        compiled_dir,
+        extra_arrays={
+            f"{PREPROCESSOR_ARRAY_PREFIX}{name}": array for name, array in fast_preprocessor.to_arrays().items()
+        },
+        verified=True,
+        source=file_fingerprint(model_path),
+        preprocessor_source=file_fingerprint(preprocessor_path),
+        preprocessor_features=fast_preprocessor.n_features_out,
+    )
+
+
+def load_lookup_table(lookup_dir, model_path):
+    """Load the precomputed lookup table if it was built from the current model file."""
+    try:
+        table = LookupTable.load(lookup_dir)
+    except (OSError, ValueError, KeyError):
+        return None
+    if table.meta.get("source") != file_fingerprint(model_path):
+        log(logger, logging.WARNING, "Lookup table was built for a different model file - ignoring it",
+            directory=lookup_dir)
+        return None
+    log(logger, logging.INFO, "Lookup table loaded", directory=lookup_dir, entries=len(table),
+        megabytes=round(table.nbytes / 1e6, 1), coverage=table.meta.get("coverage"))
+    return table
+
+
+def compile_preprocessor(preprocessor):
+    """
+    Compile the preprocessor into a NumPy feature mapping. It is checked against
+    the sklearn transform and only returned when both agree exactly, so the fast
+    path can never silently diverge.
+    """
+    try:
+        compiled = CompiledPreprocessor(preprocessor)
+        max_diff = compiled.verify(preprocessor)
+        if max_diff == 0.0:
+            logger.info("Fast preprocessing path enabled")
+            return compiled
+        log(logger, logging.WARNING, "Fast preprocessing diverges from sklearn - using sklearn path", max_diff=max_diff)
+    except Exception as e:
+        log(logger, logging.WARNING, "Could not compile preprocessor - using sklearn path", error=str(e))
+    return None
+
+
+def compile_forest(model, preprocessor):
+    """Flatten the forest; only returned if it reproduces model.predict_proba exactly on random inputs."""
+    import pandas as pd
+
+    try:
+        engine = CompiledForest(model)
+        sample = preprocessor.transform(pd.DataFrame(sample_feature_matrix(2000), columns=FEATURE_COLUMNS))
+        if np.array_equal(engine.predict_proba(sample), model.predict_proba(sample)) and \
+                np.array_equal(engine.predict_proba(sample[:1]), model.predict_proba(sample[:1])):
+            log(logger, logging.INFO, "Compiled forest engine enabled", megabytes=round(engine.nbytes / 1e6, 1))
+            return engine
+        logger.warning("Compiled forest diverges from model.predict_proba - using sklearn backend")
+    except Exception as e:
+        log(logger, logging.WARNING, "Could not compile forest - using sklearn backend", error=str(e))
+    return None
+
+
+def export_compiled_artifact(model_path, preprocessor_path, compiled_dir):
+    """Compile, verify and store the artifact for a model written by training; returns whether it was written."""
+    import joblib
+
+    preprocessor = joblib.load(preprocessor_path)
+    fast_preprocessor = compile_preprocessor(preprocessor)
+    compiled_forest = compile_forest(joblib.load(model_path), preprocessor)
+    if compiled_forest is None or fast_preprocessor is None:
+        return False
+    save_compiled_artifact(compiled_dir, compiled_forest, fast_preprocessor, model_path, preprocessor_path)
+    return True
+
+
+def load_serving_model(version, model_path, preprocessor_path, backend="compiled", compiled_dir=None,
+                       shared=False, persist_compiled=False, compiled_max_rows=64, metadata=None, lookup_dir=None):
+    """
+    Load one model version and build its fast paths.
+
+    When ``compiled_dir`` holds an artifact verified against the same model and
+    preprocessor files it is loaded instead of unpickling anything (memory-mapped
+    with ``shared``, so other processes map the same pages); the sklearn objects
+    are then only unpickled if a caller needs them. Otherwise the pickles are
+    loaded, compiled, verified and (with ``persist_compiled`` or ``shared``)
+    written to ``compiled_dir`` for the next start. A lookup table in
+    ``lookup_dir`` built for the same model file answers its vectors directly.
+    The duration of each step is kept in ``load_profile``.
+    """
+    profile = {}
+    started = step = time.perf_counter()
+
+    def mark(name):
+        nonlocal step
+        now = time.perf_counter()
+        profile[name] = round((now - step) * 1000, 1)
+        step = now
+
+    model = preprocessor = compiled_forest = fast_preprocessor = artifact_dir = None
+    if compiled_dir and (backend == "compiled" or shared):
+        compiled_forest, fast_preprocessor = load_compiled_artifact(
+            compiled_dir, model_path, preprocessor_path, mmap_mode='r' if shared else None)
+        mark("artifact_ms")
+
+    if compiled_forest is not None:
+        profile["source"] = "artifact"
+        artifact_dir = compiled_dir
+        log(logger, logging.INFO, "Loaded compiled model artifact", directory=compiled_dir, mapped=shared)
+    else:
+        import joblib
+
+        profile["source"] = "pickle"
+        preprocessor = joblib.load(preprocessor_path)
+        model = joblib.load(model_path)
+        mark("unpickle_ms")
+        fast_preprocessor = compile_preprocessor(preprocessor)
+        if backend == "compiled" or shared:
+            compiled_forest = compile_forest(model, preprocessor)
+        mark("compile_ms")
+        if compiled_forest is not None and fast_preprocessor is not None and compiled_dir and \
+                (shared or persist_compiled):
+            try:
+                save_compiled_artifact(compiled_dir, compiled_forest, fast_preprocessor, model_path, preprocessor_path)
+                artifact_dir = compiled_dir
+                log(logger, logging.INFO, "Compiled model artifact written", directory=compiled_dir)
+                if shared:
+                    compiled_forest = CompiledForest.load(compiled_dir, mmap_mode='r')
+            except OSError as e:
+                log(logger, logging.WARNING, "Could not write compiled model artifact", directory=compiled_dir,
+                    error=str(e))
+            mark("persist_ms")
+
+    lookup = load_lookup_table(lookup_dir, model_path) if lookup_dir and os.path.isdir(lookup_dir) else None
+    mark("lookup_ms")
+    profile["total_ms"] = round((time.perf_counter() - started) * 1000, 1)
+
+    return ServingModel(
+        version, model, preprocessor,
+        fast_preprocessor=fast_preprocessor,
+        compiled_forest=compiled_forest,
+        compiled_dir=artifact_dir,
+        compiled_max_rows=compiled_max_rows,
+        metadata=metadata,
+        lookup=lookup,
+        model_path=model_path,
+        preprocessor_path=preprocessor_path,
+        load_profile=profile,
+    )
@@ -0,0 +1,193 @@
+import asyncio
+import datetime
+import os
+import sys
+
+import mongomock.collection
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import retention  # noqa: E402
+from features import STYLE_NAMES  # noqa: E402
+from retention import RAW_TTL_INDEX, ROLLUPS_COLLECTION, RetentionJob  # noqa: E402
+
+NOW = datetime.datetime(2026, 10, 18, 12, 30)
+
+
+@pytest.fixture
+def mongomock_compat(monkeypatch):
+    # mongomock has no $dateTrunc/$toDate: bucket by date parts instead. The
+    # pipelines MongoDB runs are checked directly in test_bucket_pipelines.
+    bucket_pipeline = retention.bucket_pipeline
+
+    def date_parts_pipeline(match, date, unit, count, probabilities):
+        date = date.get("$toDate", date) if isinstance(date, dict) else date
+        parts = {"year": {"$year": date}, "month": {"$month": date}, "day": {"$dayOfMonth": date}}
+        if unit == "hour":
+            parts["hour"] = {"$hour": date}
+        pipeline = bucket_pipeline(match, date, unit, count, probabilities)
+        pipeline[1]["$group"]["_id"]["bucket"] = {"$dateFromParts": parts}
+        return pipeline
+
+    monkeypatch.setattr(retention, "bucket_pipeline", date_parts_pipeline)
+    # ... and rejects the sort argument newer pymongo passes for UpdateOne
+    add_update = mongomock.collection.BulkOperationBuilder.add_update
+    monkeypatch.setattr(mongomock.collection.BulkOperationBuilder, "add_update",
+                        lambda self, *args, sort=None, **kwargs: add_update(self, *args, **kwargs))
+
+
+@pytest.fixture
+def database(mongomock_compat):
+    return AsyncMongoMockClient()["test"]
+
+
+def prediction(predicted_at, learning_style, probabilities):
+    return {"predicted_at": predicted_at, "learning_style": learning_style, "probabilities": probabilities}
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+async def rollups(database, granularity):
+    documents = await database[ROLLUPS_COLLECTION].find({"granularity": granularity}).to_list(length=None)
+    return {(d["bucket_start"], d["learning_style"]): (d["count"], d["probability_sums"]) for d in documents}
+
+
+def test_bucket_pipelines():
+    match = {"predicted_at": {"$gte": NOW - retention.DAY, "$lt": NOW}}
+    match_stage, group_stage = retention.raw_buckets(match, "hour")
+    assert match_stage == {"$match": match}
+    group = group_stage["$group"]
+    assert group["_id"] == {
+        "bucket": {"$dateTrunc": {"date": {"$toDate": "$predicted_at"}, "unit": "hour"}},
+        "learning_style": "$learning_style",
+    }
+    assert group["count"] == {"$sum": 1}
+    for idx in range(len(STYLE_NAMES)):
+        assert group[f"p{idx}"] == {"$sum": {"$arrayElemAt": ["$probabilities", idx]}}
+    assert len(group) == 2 + len(STYLE_NAMES)
+
+    group = retention.rollup_buckets({"granularity": "hour"}, "day")[1]["$group"]
+    assert group["_id"]["bucket"] == {"$dateTrunc": {"date": "$bucket_start", "unit": "day"}}
+    assert group["count"] == {"$sum": "$count"}
+    assert group["p3"] == {"$sum": {"$arrayElemAt": ["$probability_sums", 3]}}
+
+
+def test_rejects_ttls_shorter_than_the_compaction_delay(database):
+    with pytest.raises(ValueError):
+        RetentionJob(database, raw_days=1, compact_after_hours=24)
+    with pytest.raises(ValueError):
+        RetentionJob(database, raw_days=30, compact_after_hours=24, hourly_days=2)
+
+
+def test_compacts_into_hourly_and_daily_rollups(database):
+    async def scenario():
+        await database["predictions"].insert_many([
+            prediction(datetime.datetime(2026, 10, 15, 9, 10), 0, [0.7, 0.1, 0.1, 0.1]),
+            prediction(datetime.datetime(2026, 10, 15, 9, 50), 0, [0.5, 0.2, 0.2, 0.1]),
+            prediction(datetime.datetime(2026, 10, 15, 11, 5), 2, [0.1, 0.1, 0.6, 0.2]),
+            # Written before timestamps were stored natively
+            prediction("2026-10-16T08:15:00", 0, [0.4, 0.3, 0.2, 0.1]),
+            # Newer than the compaction delay, left raw
+            prediction(datetime.datetime(2026, 10, 18, 10, 0), 1, [0.1, 0.8, 0.05, 0.05]),
+        ])
+        job = RetentionJob(database, raw_days=30, compact_after_hours=24)
+        result = await job.run_once(NOW)
+
+        assert result["migrated"] == 1
+        assert result["compacted_until"] == datetime.datetime(2026, 10, 17, 12)
+        assert await retention.read_watermark(database) == datetime.datetime(2026, 10, 17, 12)
+
+        hourly = await rollups(database, "hour")
+        assert set(hourly) == {
+            (datetime.datetime(2026, 10, 15, 9), 0),
+            (datetime.datetime(2026, 10, 15, 11), 2),
+            (datetime.datetime(2026, 10, 16, 8), 0),
+        }
+        count, sums = hourly[(datetime.datetime(2026, 10, 15, 9), 0)]
+        assert count == 2
+        assert sums == pytest.approx([1.2, 0.3, 0.3, 0.2])
+
+        daily = await rollups(database, "day")
+        assert daily[(datetime.datetime(2026, 10, 15), 0)][0] == 2
+        assert daily[(datetime.datetime(2026, 10, 15), 2)][0] == 1
+        assert daily[(datetime.datetime(2026, 10, 16), 0)][0] == 1
+        assert sum(count for count, _ in daily.values()) == 4
+
+    run(scenario())
+
+
+def test_repeating_a_window_does_not_double_count(database):
+    async def scenario():
+        await database["predictions"].insert_many([
+            prediction(datetime.datetime(2026, 10, 16, hour), hour % 4, [0.25] * 4) for hour in range(24)
+        ])
+        job = RetentionJob(database, raw_days=30, compact_after_hours=24)
+        await job.run_once(NOW)
+        before = (await rollups(database, "hour"), await rollups(database, "day"))
+
+        # As if the previous run died after writing rollups but before the watermark
+        await database[retention.STATE_COLLECTION].update_one(
+            {"_id": retention.STATE_ID}, {"$set": {"compacted_until": datetime.datetime(2026, 10, 16, 6)}})
+        await job.run_once(NOW)
+        assert (await rollups(database, "hour"), await rollups(database, "day")) == before
+
+    run(scenario())
+
+
+def test_raw_ttl_index_waits_for_the_backfill(database, monkeypatch):
+    async def scenario():
+        # 60 days of history against 30 days of raw retention
+        await database["predictions"].insert_many([
+            prediction((NOW - datetime.timedelta(days=day)).isoformat(), 0, [0.25] * 4) for day in range(60)
+        ])
+        job = RetentionJob(database, raw_days=30, compact_after_hours=24)
+        indexes_seen = []
+        compact_window = job._compact_window
+
+        async def tracking_compact_window(start, end):
+            indexes_seen.append(RAW_TTL_INDEX in await database["predictions"].index_information())
+            await compact_window(start, end)
+
+        monkeypatch.setattr(job, "_compact_window", tracking_compact_window)
+        await job.run_once(NOW)
+
+        assert indexes_seen and not any(indexes_seen)
+        assert job.raw_ttl_ready
+        ttl = (await database["predictions"].index_information())[RAW_TTL_INDEX]
+        assert ttl["expireAfterSeconds"] == 30 * 86400
+        # All but the two within the compaction delay
+        assert sum(count for count, _ in (await rollups(database, "day")).values()) == 58
+
+    run(scenario())
+
+
+def test_raw_ttl_index_is_left_alone_while_compaction_is_behind(database):
+    async def scenario():
+        job = RetentionJob(database, raw_days=30, compact_after_hours=24)
+        job.compacted_until = NOW - datetime.timedelta(days=45)
+        assert not await job.ensure_raw_ttl(NOW)
+        assert RAW_TTL_INDEX not in await database["predictions"].index_information()
+
+        job.compacted_until = NOW - datetime.timedelta(days=1)
+        assert await job.ensure_raw_ttl(NOW)
+        assert RAW_TTL_INDEX in await database["predictions"].index_information()
+
+    run(scenario())
+
+
+def test_lease_keeps_a_second_process_out(database):
+    async def scenario():
+        await database[retention.STATE_COLLECTION].insert_one(
+            {"_id": retention.STATE_ID, "lease_until": NOW + datetime.timedelta(minutes=5), "lease_owner": "other"})
+        job = RetentionJob(database, raw_days=30, compact_after_hours=24)
+        assert await job.run_once(NOW) is None
+        assert job.skipped_runs == 1
+
+        # An expired lease is taken over
+        assert await job.run_once(NOW + datetime.timedelta(minutes=10)) is not None
+
+    run(scenario())
@@ -0,0 +1,97 @@
+"""
+Request and response encodings for the prediction endpoints.
+
+Besides JSON, /predict-style and /predict-style/batch accept a packed binary
+body and can answer with packed probabilities, for internal callers that send
+a lot of traffic:
+
+* Request  ``Content-Type: application/x-student-features`` - one 15-byte
+  record per student, one unsigned byte per field in FEATURE_COLUMNS order
+  (every field range fits in a byte). /predict-style takes exactly one record.
+* Response ``Accept: application/x-style-probabilities`` - little-endian
+  float32 probabilities, len(STYLE_NAMES) per record in STYLE_NAMES order.
+  The predicted style is the index of the largest value; the serving model
+  version is in the X-Model-Version header.
+
+Either side can be used on its own, e.g. a packed request with a JSON response.
+"""
+import json
+
+import numpy as np
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import JSONResponse
+
+from features import FEATURE_COLUMNS, FEATURE_RANGES, STYLE_NAMES
+
+try:
+    import orjson
+except ImportError:  # optional; the standard library encoder is used without it
+    orjson = None
+
+FEATURES_MEDIA_TYPE = "application/x-student-features"
+PROBABILITIES_MEDIA_TYPE = "application/x-style-probabilities"
+RECORD_SIZE = len(FEATURE_COLUMNS)
+
+_LOWS = np.array([FEATURE_RANGES[column][0] for column in FEATURE_COLUMNS], dtype=np.uint8)
+_HIGHS = np.array([FEATURE_RANGES[column][1] for column in FEATURE_COLUMNS], dtype=np.uint8)
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    Compact JSON rendering (orjson when installed). Endpoints return it
+    directly with plain Python values, which also skips FastAPI's
+    jsonable_encoder pass over the response.
+    """
+
+    def render(self, content):
+        if orjson is not None:
+            return orjson.dumps(content)
+        return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+def is_packed_request(request):
+    return request.headers.get("content-type", "").split(";")[0].strip().lower() == FEATURES_MEDIA_TYPE
+
+
+def wants_packed_response(request):
+    return PROBABILITIES_MEDIA_TYPE in request.headers.get("accept", "").lower()
+
+
+def decode_features(body, max_records=None):
+    """
+    Decode a packed feature body into StudentData dicts. Errors are raised as
+    RequestValidationError in the same shape as a failed JSON body.
+    """
+    if not body or len(body) % RECORD_SIZE:
+        raise RequestValidationError([{
+            "type": "packed_length",
+            "loc": ("body",),
+            "msg": f"Packed body must be a non-empty multiple of {RECORD_SIZE} bytes",
+            "input": f"{len(body)} bytes",
+        }])
+    rows = np.frombuffer(body, dtype=np.uint8).reshape(-1, RECORD_SIZE)
+    if max_records is not None and len(rows) > max_records:
+        raise RequestValidationError([{
+            "type": "packed_length",
+            "loc": ("body",),
+            "msg": f"Expected at most {max_records} record(s), got {len(rows)}",
+            "input": f"{len(body)} bytes",
+        }])
+
+    invalid = (rows < _LOWS) | (rows > _HIGHS)
+    if invalid.any():
+        raise RequestValidationError([
+            {
+                "type": "packed_range",
+                "loc": ("body", int(row), FEATURE_COLUMNS[column]),
+                "msg": f"Input should be between {_LOWS[column]} and {_HIGHS[column]}",
+                "input": int(rows[row, column]),
+            }
+            for row, column in zip(*np.nonzero(invalid))
+        ])
+    return [dict(zip(FEATURE_COLUMNS, row)) for row in rows.tolist()]
+
+
+def encode_probabilities(probabilities):
+    """Pack a sequence of probability vectors as little-endian float32."""
+    return np.asarray(probabilities, dtype="<f4").reshape(-1, len(STYLE_NAMES)).tobytes()
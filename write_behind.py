@@ -0,0 +1,158 @@
+import asyncio
+import time
+
+from pymongo.errors import BulkWriteError
+
+
+class WriteBehindQueue:
+    """
+    Bounded in-memory buffer that persists documents in the background.
+
+    Producers call ``enqueue`` and return immediately; a background task flushes
+    the buffer with ``insert_many`` whenever ``batch_size`` documents are pending
+    or ``flush_interval`` seconds have passed since the first pending document.
+
+    When the buffer is full the ``policy`` decides what happens to new writes:
+    ``"drop"`` discards them (and counts them), ``"block"`` makes the producer
+    wait for space, which pushes back on callers while MongoDB is unavailable.
+    A batch that fails with a transient error is kept and retried, so memory
+    stays bounded by ``max_pending`` plus one batch.
+    """
+
+    def __init__(self, insert_many, batch_size=500, flush_interval=0.2, max_pending=10000,
+                 policy="drop", retry_interval=1.0):
+        if policy not in ("drop", "block"):
+            raise ValueError(f"Unknown write-behind policy: {policy}")
+        self._insert_many = insert_many
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retry_interval = retry_interval
+        self.policy = policy
+        self._queue = asyncio.Queue(maxsize=max_pending)
+        self._task = None
+        self._closed = False
+        self._busy = False
+
+        self.enqueued = 0
+        self.dropped = 0
+        self.flushes = 0
+        self.failed_flushes = 0
+        self.written = 0
+        self.last_batch_size = 0
+        self.max_batch_size = 0
+        self.last_error = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def enqueue(self, document):
+        """Buffer a document; returns False if it was dropped."""
+        if self._closed:
+            self.dropped += 1
+            return False
+        if self.policy == "block":
+            await self._queue.put(document)
+        else:
+            try:
+                self._queue.put_nowait(document)
+            except asyncio.QueueFull:
+                self.dropped += 1
+                return False
+        self.enqueued += 1
+        return True
+
+    async def enqueue_many(self, documents):
+        accepted = 0
+        for document in documents:
+            accepted += await self.enqueue(document)
+        return accepted
+
+    async def _next_batch(self):
+        """Wait for the first document, then collect more until the batch is full or the interval ends."""
+        batch = [await self._queue.get()]
+        self._busy = True
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            while len(batch) < self.batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            remaining = deadline - time.monotonic()
+            if len(batch) >= self.batch_size or remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout=remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _flush(self, batch):
+        """Write one batch, retrying transient failures until it succeeds or the queue is closed."""
+        while True:
+            try:
+                await self._insert_many(batch)
+                self.written += len(batch)
+                break
+            except BulkWriteError as e:
+                # Individual documents were rejected (e.g. duplicate keys); retrying won't help
+                self.written += e.details.get("nInserted", 0)
+                self.failed_flushes += 1
+                self.last_error = str(e)
+                break
+            except Exception as e:
+                self.failed_flushes += 1
+                self.last_error = str(e)
+                if self._closed:
+                    self.dropped += len(batch)
+                    break
+                await asyncio.sleep(self.retry_interval)
+
+        self.flushes += 1
+        self.last_batch_size = len(batch)
+        self.max_batch_size = max(self.max_batch_size, len(batch))
+
+    async def _run(self):
+        while True:
+            batch = await self._next_batch()
+            try:
+                await self._flush(batch)
+            finally:
+                self._busy = False
+
+    async def drain(self, timeout=5.0):
+        """Stop accepting writes and wait for the worker to flush everything still pending."""
+        self._closed = True
+        if self._task is None:
+            return
+
+        async def wait_idle():
+            while not self._queue.empty() or self._busy:
+                await asyncio.sleep(0.01)
+
+        try:
+            await asyncio.wait_for(wait_idle(), timeout=timeout)
+        except asyncio.TimeoutError:
+            self.last_error = "Timed out draining pending writes"
+
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        self.dropped += self._queue.qsize()
+
+    def stats(self):
+        return {
+            "policy": self.policy,
+            "queue_depth": self._queue.qsize(),
+            "max_pending": self._queue.maxsize,
+            "enqueued": self.enqueued,
+            "written": self.written,
+            "dropped": self.dropped,
+            "flushes": self.flushes,
+            "failed_flushes": self.failed_flushes,
+            "last_batch_size": self.last_batch_size,
+            "max_batch_size": self.max_batch_size,
+            "avg_batch_size": round(self.written / self.flushes, 2) if self.flushes else 0,
+            "last_error": self.last_error,
+        }